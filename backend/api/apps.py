@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     name = 'api'
     verbose_name = 'интерфейс'
+
+    def ready(self):
+        from api import signals  # noqa: F401
@@ -0,0 +1,33 @@
+from api.serializers import IngredientSerializer, TagSerializer
+from core.catalog import CatalogSnapshot, VersionedCatalog
+from recipes.models import Ingredient, Tag
+from recipes.search import IngredientIndex
+
+
+class TagSnapshot(CatalogSnapshot):
+    def __init__(self, version, items):
+        super().__init__(version, items)
+        self.id_by_slug = {item['slug']: item['id'] for item in items}
+
+    def get_ids(self, slugs):
+        return [
+            self.id_by_slug[slug] for slug in slugs if slug in self.id_by_slug
+        ]
+
+
+class IngredientSnapshot(CatalogSnapshot):
+    def __init__(self, version, items):
+        super().__init__(version, items)
+        self.index = IngredientIndex(items)
+
+
+tags_catalog = VersionedCatalog(
+    'tags',
+    lambda: TagSerializer(Tag.objects.all(), many=True).data,
+    snapshot_class=TagSnapshot,
+)
+ingredients_catalog = VersionedCatalog(
+    'ingredients',
+    lambda: IngredientSerializer(Ingredient.objects.all(), many=True).data,
+    snapshot_class=IngredientSnapshot,
+)
@@ -1,13 +1,74 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+# Размер части base64-строки, декодируемой за один раз. Кратен четырём,
+# чтобы каждая часть декодировалась независимо от соседних.
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл с декодированной картинкой.
+
+    Хранилище может переместить файл при сохранении, поэтому он
+    закрывается при удалении объекта, а отсутствие файла на диске в
+    этот момент не считается ошибкой.
+    """
+
+    def __del__(self):
+        self.close()
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка, переданная строкой data:image/<формат>;base64,<данные>.
+
+    Строка декодируется по частям во временный файл на диске. Размер
+    файла проверяется до декодирования, а число пикселей - по заголовку
+    картинки, до того как Pillow прочитает её целиком.
+    """
+
+    default_error_messages = {
+        **serializers.ImageField.default_error_messages,
+        'invalid_base64': 'Картинка должна быть закодирована в base64.',
+        'too_large': 'Размер картинки не должен превышать {max_size} байт.',
+        'too_many_pixels': (
+            'Картинка не должна содержать больше {max_pixels} пикселей.'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext, format.split(':')[-1])
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, name, content_type):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(imgstr) // 4 * 3 > max_size:
+            self.fail('too_large', max_size=max_size)
+        file = DecodedImageFile(name, content_type, 0, None)
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                end = start + DECODE_CHUNK_SIZE
+                file.write(base64.b64decode(imgstr[start:end], validate=True))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        file.seek(0)
+        try:
+            width, height = Image.open(file).size
+        except Exception:
+            file.close()
+            self.fail('invalid_image')
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            file.close()
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        file.seek(0)
+        return file
@@ -1,4 +1,8 @@
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
+from rest_framework.response import Response
 
 
 class ListRetrieveAPIView(
@@ -18,3 +22,74 @@ class CRUDAPIView(
     viewsets.GenericViewSet,
 ):
     pass
+
+
+class ConditionalResponseMixin:
+    """Ответ с ETag/Last-Modified и поддержкой условных GET запросов.
+
+    Ответ собирается только если клиент не прислал совпадающие
+    If-None-Match или If-Modified-Since, иначе сразу отдаётся 304.
+    Заголовки из vary_headers попадают в Vary, если ответ от них зависит.
+    """
+
+    vary_headers = ()
+
+    def get_conditional_response(
+        self,
+        request,
+        get_response,
+        etag=None,
+        last_modified=None,
+    ):
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = get_response()
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, self.vary_headers)
+        return response
+
+
+class CatalogAPIView(ConditionalResponseMixin, ListRetrieveAPIView):
+    """Справочник, который отдаётся из кэша в памяти воркера.
+
+    ETag ответа строится по версии справочника, поэтому клиент может
+    перепроверить данные запросом с If-None-Match и получить 304.
+    """
+
+    catalog = None
+
+    def filter_catalog(self, snapshot):
+        return snapshot.items
+
+    def get_catalog_response(self, request, snapshot, get_data):
+        return self.get_conditional_response(
+            request,
+            lambda: Response(get_data()),
+            etag=f'"{snapshot.version}"',
+        )
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self.catalog.load()
+        return self.get_catalog_response(
+            request,
+            snapshot,
+            lambda: self.filter_catalog(snapshot),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = self.catalog.load()
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if not pk.isdigit() or int(pk) not in snapshot.by_id:
+            raise Http404
+        return self.get_catalog_response(
+            request,
+            snapshot,
+            lambda: snapshot.by_id[int(pk)],
+        )
@@ -0,0 +1,84 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework import renderers
+
+SHOPPING_CART_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(ABC, renderers.BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки агрегата отдаются по одной через `stream`, поэтому список
+    покупок можно передавать в StreamingHttpResponse, не собирая его
+    целиком в памяти. Ответы с ошибками рендерятся error_renderer_class.
+    """
+
+    charset = 'utf-8'
+    error_renderer_class = renderers.JSONRenderer
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream(data)).encode(self.charset)
+
+    @abstractmethod
+    def stream(self, ingredients):
+        """Возвращает итератор по частям выгружаемого файла."""
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOPPING_CART_HEADER)
+        for ingredient in ingredients:
+            yield writer.writerow(
+                (
+                    ingredient['ingredient__name'],
+                    ingredient['total'],
+                    ingredient['ingredient__measurement_unit'],
+                ),
+            )
+
+
+class ShoppingCartTXTRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield 'Список покупок:\n'
+        for ingredient in ingredients:
+            yield (
+                f'{ingredient["ingredient__name"]} '
+                f'({ingredient["ingredient__measurement_unit"]}) — '
+                f'{ingredient["total"]}\n'
+            )
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        yield '['
+        for number, ingredient in enumerate(ingredients):
+            yield (',' if number else '') + json.dumps(
+                {
+                    'name': ingredient['ingredient__name'],
+                    'amount': ingredient['total'],
+                    'measurement_unit': ingredient[
+                        'ingredient__measurement_unit'
+                    ],
+                },
+                ensure_ascii=False,
+            )
+        yield ']'
@@ -1,8 +1,14 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
 from api.fields import Base64ImageField
-from core.utils import add_tags_and_ingredients, checking_availability
+from core.utils import (
+    add_tags_and_ingredients,
+    checking_availability,
+    update_ingredients,
+)
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -38,10 +44,23 @@ class RepresentationIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+def get_objects_by_ids(model, ids, text):
+    """Находит все объекты по списку id одним запросом.
+
+    Если каких-то объектов нет, все ненайденные id возвращаются
+    одной ошибкой валидации.
+    """
+    objects = model.objects.in_bulk(set(ids))
+    missing = sorted(set(ids) - objects.keys())
+    if missing:
+        raise serializers.ValidationError(
+            f'{text} не найдены: {", ".join(map(str, missing))}.',
+        )
+    return objects
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -50,10 +69,9 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    tags = serializers.SlugRelatedField(
-        slug_field='id',
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True,
     )
     author = SpecialUserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(many=True, write_only=True)
@@ -95,14 +113,19 @@ class RecipeSerializer(serializers.ModelSerializer):
             ShoppingCart,
         )
 
+    def validate_tags(self, value):
+        tags = get_objects_by_ids(Tag, value, 'Теги')
+        return [tags[id] for id in dict.fromkeys(value)]
+
     def validate_ingredients(self, value):
-        ingredients = []
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиенты не могут повторяться в рецепте!',
+            )
+        ingredients = get_objects_by_ids(Ingredient, ids, 'Ингредиенты')
         for ingredient in value:
-            if ingredient['id'] in ingredients:
-                raise serializers.ValidationError(
-                    'Ингредиенты не могут повторяться в рецепте!',
-                )
-            ingredients.append(ingredient['id'])
+            ingredient['id'] = ingredients[ingredient['id']]
         return value
 
     def validate(self, data):
@@ -115,6 +138,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(errors)
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -122,17 +146,16 @@ class RecipeSerializer(serializers.ModelSerializer):
         add_tags_and_ingredients(tags, ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        add_tags_and_ingredients(tags, ingredients, instance)
+        instance.tags.set(validated_data.pop('tags'))
+        update_ingredients(instance, validated_data.pop('ingredients'))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['ingredients'] = RepresentationIngredientSerializer(
-            instance.ingredient_in_recipe.all(),
+            instance.ingredient_in_recipe.select_related('ingredient'),
             many=True,
         ).data
         representation['tags'] = TagSerializer(
@@ -150,9 +173,10 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
         source='ingredient_in_recipe',
         read_only=True,
     )
-    is_favorited = SerializerMethodField(read_only=True)
-    is_in_shopping_cart = SerializerMethodField(read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
     image = Base64ImageField()
+    images = SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -165,6 +189,7 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
@@ -174,19 +199,47 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
             'modified',
         )
 
-    def get_is_favorited(self, object):
-        return checking_availability(
-            self.context.get('request').user,
-            object,
-            Favorite,
+    def get_images(self, object):
+        request = self.context.get('request')
+        return {
+            rendition: {
+                extension: request.build_absolute_uri(
+                    object.image.storage.url(name),
+                )
+                for extension, name in files.items()
+            }
+            for rendition, files in object.get_image_renditions().items()
+        }
+
+
+class RecipeCoverageSerializer(RecipeReadOnlySerializer):
+    covered = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeReadOnlySerializer.Meta):
+        fields = RecipeReadOnlySerializer.Meta.fields + (
+            'covered',
+            'missing',
+            'coverage',
         )
 
-    def get_is_in_shopping_cart(self, object):
-        return checking_availability(
-            self.context.get('request').user,
-            object,
-            ShoppingCart,
-        )
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.NUM_OBJECTS_IN_BULK,
+    )
+
+
+class IngredientsOnHandSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.NUM_INGREDIENTS_ON_HAND,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
 
 
 class RecipeInActionSerializer(serializers.ModelSerializer):
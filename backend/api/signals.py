@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.catalogs import ingredients_catalog, tags_catalog
+from core.relations import relations_changed
+from core.stamps import (
+    RECIPES_STAMP_KEY,
+    touch_stamp_on_commit,
+    user_stamp_key,
+)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscribe, User
+
+# Поля пользователя, которые выдаются как автор в каждом рецепте.
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_catalog(sender, **kwargs):
+    transaction.on_commit(tags_catalog.bump)
+    touch_stamp_on_commit(RECIPES_STAMP_KEY)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_catalog(sender, **kwargs):
+    transaction.on_commit(ingredients_catalog.bump)
+    touch_stamp_on_commit(RECIPES_STAMP_KEY)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def touch_recipes_stamp(sender, **kwargs):
+    touch_stamp_on_commit(RECIPES_STAMP_KEY)
+
+
+@receiver(post_save, sender=User)
+def touch_recipes_stamp_on_author_change(
+    sender,
+    created,
+    update_fields,
+    **kwargs,
+):
+    if created:
+        return
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        touch_stamp_on_commit(RECIPES_STAMP_KEY)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def touch_user_stamp(sender, instance, **kwargs):
+    touch_stamp_on_commit(user_stamp_key(instance.user_id))
+
+
+@receiver(relations_changed, sender=Favorite)
+@receiver(relations_changed, sender=ShoppingCart)
+@receiver(relations_changed, sender=Subscribe)
+def touch_user_stamp_in_bulk(sender, user_id, **kwargs):
+    touch_stamp_on_commit(user_stamp_key(user_id))
@@ -6,6 +6,7 @@ from django.test import TestCase, override_settings
 from mixer.backend.django import mixer
 from rest_framework.test import APIClient
 
+from recipes.models import Recipe
 from users.models import User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -47,3 +48,25 @@ class RecipesPaginatorTests(TestCase):
                     len(self.authorized_user.get(url).json()['results']),
                     num_object,
                 )
+
+    def test_cursor_paginator(self) -> None:
+        """Курсорная пагинация проходит все рецепты без повторов."""
+        url = '/api/recipes/?pagination=cursor'
+        recipes = []
+        pages = 0
+        while url:
+            page = self.authorized_user.get(url).json()
+            self.assertNotIn('count', page)
+            recipes += [recipe['id'] for recipe in page['results']]
+            url = page['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            recipes,
+            list(
+                Recipe.objects.order_by('-created', 'id').values_list(
+                    'id',
+                    flat=True,
+                ),
+            ),
+        )
@@ -1,13 +1,53 @@
+import asyncio
+import base64
+import json
+import os
+import posixpath
+import re
 import shutil
 import tempfile
+import time
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from itertools import islice, takewhile
+from pathlib import Path
+from threading import Barrier, Thread
+from unittest import skipIf
+from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from mixer.backend.django import mixer
-from rest_framework.test import APIClient
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory
 
-from recipes.models import Favorite, Recipe, ShoppingCart
-from users.models import User
+from api.catalogs import tags_catalog
+from api.urls import router
+from api.views import RecipeAPIView
+from core.async_views import async_read_urls, async_read_view
+from core.signals import check_db_connections
+from core.stamps import RECIPES_STAMP_KEY, get_stamp
+from core.utils import add_tags_and_ingredients, update_ingredients
+from recipes.coverage import recipe_ingredients_index
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    IngredientsIndexChange,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartTotal,
+    Tag,
+)
+from recipes.stemmer import stem
+from users.models import Subscribe, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -266,3 +306,1899 @@ class RecipesViewsTests(TestCase):
             Favorite.objects.count(),
             settings.CHECK_ONE_OBJECT_FOR_TEST,
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipesQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.tags = mixer.cycle(2).blend('recipes.Tag')
+        cls.ingredients = mixer.cycle(3).blend('recipes.Ingredient')
+        cls.recipes = mixer.cycle(12).blend('recipes.Recipe', tags=cls.tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in cls.recipes
+            for ingredient in cls.ingredients
+        )
+        mixer.blend(
+            'users.Subscribe',
+            user=cls.user,
+            following=cls.recipes[0].author,
+        )
+        mixer.blend('recipes.Favorite', user=cls.user, recipe=cls.recipes[0])
+        mixer.blend(
+            'recipes.ShoppingCart',
+            user=cls.user,
+            recipe=cls.recipes[1],
+        )
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def count_flag_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_user.get(url)
+        return sum(
+            'recipes_favorite' in query['sql']
+            or 'recipes_shoppingcart' in query['sql']
+            for query in context.captured_queries
+        )
+
+    def test_flags_queries_do_not_depend_on_page_size(self) -> None:
+        """Число запросов к избранному и списку покупок не зависит от limit."""
+        self.assertEqual(
+            self.count_flag_queries('/api/recipes/?limit=2'),
+            self.count_flag_queries('/api/recipes/?limit=12'),
+        )
+
+    def test_list_queries_do_not_depend_on_page_size(self) -> None:
+        """Число запросов к списку рецептов не зависит от limit."""
+        for client in (self.client, self.authorized_user):
+            with self.subTest(client=client):
+                with CaptureQueriesContext(connection) as small_page:
+                    client.get('/api/recipes/?limit=2')
+                with CaptureQueriesContext(connection) as large_page:
+                    client.get('/api/recipes/?limit=12')
+                self.assertEqual(len(small_page), len(large_page))
+
+    def test_tags_filter_without_distinct(self) -> None:
+        """Фильтр по тегам не дублирует рецепты и обходится без DISTINCT."""
+        cache.clear()
+        url = '/api/recipes/?limit=12' + ''.join(
+            f'&tags={tag.slug}' for tag in self.tags
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_user.get(url).json()
+        self.assertEqual(response['count'], len(self.recipes))
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response['results']),
+            sorted(recipe.id for recipe in self.recipes),
+        )
+        for query in context.captured_queries:
+            with self.subTest(query=query['sql']):
+                self.assertNotIn('DISTINCT', query['sql'])
+
+    def test_retrieve_returns_whole_object_graph(self) -> None:
+        """Рецепт отдаётся с автором, тегами и ингредиентами."""
+        recipe = self.authorized_user.get(
+            f'/api/recipes/{self.recipes[0].id}/',
+        ).json()
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(len(recipe['tags']), len(self.tags))
+        self.assertEqual(len(recipe['ingredients']), len(self.ingredients))
+
+    def test_flags_are_annotated_correctly(self) -> None:
+        """Флаги is_favorited и is_in_shopping_cart вычисляются корректно."""
+        results = {
+            recipe['id']: recipe
+            for recipe in self.authorized_user.get(
+                '/api/recipes/?limit=12',
+            ).json()['results']
+        }
+        for recipe in self.recipes:
+            with self.subTest(recipe=recipe.id):
+                self.assertEqual(
+                    results[recipe.id]['is_favorited'],
+                    recipe == self.recipes[0],
+                )
+                self.assertEqual(
+                    results[recipe.id]['is_in_shopping_cart'],
+                    recipe == self.recipes[1],
+                )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShoppingCartDownloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user, cls.another_user = mixer.cycle(2).blend(User)
+        cls.ingredient = mixer.blend(
+            'recipes.Ingredient',
+            name='Сахар',
+            measurement_unit='г',
+        )
+        for amount in (10, 15):
+            recipe = mixer.blend('recipes.Recipe')
+            IngredientInRecipe.objects.create(
+                recipe=recipe,
+                ingredient=cls.ingredient,
+                amount=amount,
+            )
+            mixer.blend('recipes.ShoppingCart', user=cls.user, recipe=recipe)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+        cls.another_authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+        cls.another_authorized_user.force_authenticate(cls.another_user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def download(self, url: str) -> str:
+        response = self.authorized_user.get(url)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_download_formats(self) -> None:
+        """Список покупок выгружается в каждом поддерживаемом формате."""
+        url = '/api/recipes/download_shopping_cart/'
+        self.assertIn('Сахар,25,г', self.download(url))
+        self.assertIn('Сахар,25,г', self.download(f'{url}?format=csv'))
+        self.assertIn('Сахар (г) — 25', self.download(f'{url}?format=txt'))
+        self.assertEqual(
+            json.loads(self.download(f'{url}?format=json')),
+            [{'name': 'Сахар', 'amount': 25, 'measurement_unit': 'г'}],
+        )
+
+    def test_download_empty_shopping_cart(self) -> None:
+        """Пустой список покупок не выгружается."""
+        self.assertEqual(
+            self.another_authorized_user.get(
+                '/api/recipes/download_shopping_cart/?format=json',
+            ).status_code,
+            HTTPStatus.BAD_REQUEST,
+        )
+
+    def test_download_errors_rendered_as_json(self) -> None:
+        """Ошибки выгрузки отдаются в JSON при любом формате файла."""
+        url = '/api/recipes/download_shopping_cart/'
+        for client, status_code in (
+            (self.another_authorized_user, HTTPStatus.BAD_REQUEST),
+            (APIClient(), HTTPStatus.UNAUTHORIZED),
+        ):
+            for query in ('', '?format=csv', '?format=txt', '?format=json'):
+                with self.subTest(status_code=status_code, query=query):
+                    response = client.get(url + query)
+                    self.assertEqual(response.status_code, status_code)
+                    self.assertEqual(
+                        response['Content-Type'],
+                        'application/json',
+                    )
+                    self.assertIsInstance(response.json(), dict)
+
+    def test_totals_follow_shopping_cart_and_recipe_changes(self) -> None:
+        """Итоги списка покупок меняются вместе с корзиной и рецептом."""
+        recipe = mixer.blend('recipes.Recipe', author=self.another_user)
+        IngredientInRecipe.objects.create(
+            recipe=recipe,
+            ingredient=self.ingredient,
+            amount=5,
+        )
+        self.another_authorized_user.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+        )
+        self.assertEqual(self.get_total(self.another_user), 5)
+        self.another_authorized_user.patch(
+            f'/api/recipes/{recipe.id}/',
+            data={
+                'tags': [mixer.blend('recipes.Tag').id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 7}],
+            },
+            format='json',
+        )
+        self.assertEqual(self.get_total(self.another_user), 7)
+        self.another_authorized_user.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/',
+        )
+        self.assertIsNone(self.get_total(self.another_user))
+
+    def test_totals_never_go_negative(self) -> None:
+        """Разошедшийся итог при уменьшении удаляется, а не уходит в минус."""
+        ShoppingCartTotal.objects.filter(user=self.user).update(total=1)
+        ShoppingCartTotal.objects.change(
+            (self.user.id,),
+            {self.ingredient.id: -25},
+        )
+        self.assertIsNone(self.get_total(self.user))
+
+    def test_rebuild_totals_command(self) -> None:
+        """Команда rebuildcarttotals находит и исправляет расхождения."""
+        ShoppingCartTotal.objects.filter(user=self.user).update(total=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuildcarttotals', '--check', stdout=StringIO())
+        call_command('rebuildcarttotals', stdout=StringIO())
+        call_command('rebuildcarttotals', '--check', stdout=StringIO())
+        self.assertEqual(self.get_total(self.user), 25)
+
+    def get_total(self, user: User) -> int:
+        return (
+            ShoppingCartTotal.objects.filter(
+                user=user,
+                ingredient=self.ingredient,
+            )
+            .values_list('total', flat=True)
+            .first()
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.author = mixer.blend(User)
+        cls.recipe = mixer.blend('recipes.Recipe', author=cls.author)
+        cls.tag = mixer.blend('recipes.Tag')
+        cls.recipe.tags.add(cls.tag)
+        cls.ingredients = mixer.cycle(4).blend('recipes.Ingredient')
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=cls.recipe,
+                ingredient=ingredient,
+                amount=10,
+            )
+            for ingredient in cls.ingredients[:3]
+        )
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.author_user = APIClient()
+
+        cls.author_user.force_authenticate(cls.author)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get_rows(self) -> dict:
+        return {
+            row.ingredient_id: (row.id, row.amount)
+            for row in IngredientInRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def test_update_changes_only_diff(self) -> None:
+        """Обновление меняет только изменившиеся ингредиенты."""
+        kept, changed, removed, added = self.ingredients
+        rows = self.get_rows()
+        response = self.author_user.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            data={
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': kept.id, 'amount': 10},
+                    {'id': changed.id, 'amount': 20},
+                    {'id': added.id, 'amount': 30},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        new_rows = self.get_rows()
+        self.assertEqual(new_rows[kept.id], rows[kept.id])
+        self.assertEqual(new_rows[changed.id], (rows[changed.id][0], 20))
+        self.assertNotIn(removed.id, new_rows)
+        self.assertEqual(new_rows[added.id][1], 30)
+
+    def test_update_skips_untouched_relations(self) -> None:
+        """Неизменившиеся теги и ингредиенты не перезаписываются."""
+        rows = self.get_rows()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_user.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                data={
+                    'name': 'Новое название',
+                    'tags': [self.tag.id],
+                    'ingredients': [
+                        {'id': ingredient.id, 'amount': 10}
+                        for ingredient in self.ingredients[:3]
+                    ],
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.get_rows(), rows)
+        tables = (
+            IngredientInRecipe._meta.db_table,
+            Recipe.tags.through._meta.db_table,
+        )
+        writes = [
+            query['sql']
+            for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            and any(table in query['sql'] for table in tables)
+        ]
+        self.assertEqual(writes, [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.author = mixer.blend(User)
+        cls.tags = mixer.cycle(3).blend('recipes.Tag')
+        cls.ingredients = mixer.cycle(10).blend('recipes.Ingredient')
+        cls.recipe = mixer.blend('recipes.Recipe', author=cls.author)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.author_user = APIClient()
+
+        cls.author_user.force_authenticate(cls.author)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get_data(self, tags: list, ingredients: list) -> dict:
+        return {
+            'tags': tags,
+            'ingredients': [
+                {'id': ingredient, 'amount': 5} for ingredient in ingredients
+            ],
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_queries_do_not_depend_on_payload_size(self) -> None:
+        """Число запросов не зависит от числа тегов и ингредиентов."""
+        ids = [ingredient.id for ingredient in self.ingredients]
+        tags = [tag.id for tag in self.tags]
+        for method, url in (
+            ('post', '/api/recipes/'),
+            ('patch', f'/api/recipes/{self.recipe.id}/'),
+        ):
+            queries = []
+            for size in (1, len(ids)):
+                with CaptureQueriesContext(connection) as context:
+                    response = getattr(self.author_user, method)(
+                        url,
+                        self.get_data(tags[:size], ids[:size]),
+                        format='json',
+                    )
+                self.assertIn(
+                    response.status_code,
+                    (HTTPStatus.OK, HTTPStatus.CREATED),
+                )
+                queries.append(len(context))
+            with self.subTest(method=method):
+                self.assertEqual(queries[0], queries[1])
+
+    def test_unknown_ids_reported_together(self) -> None:
+        """Все ненайденные id возвращаются одной ошибкой."""
+        missing = max(ingredient.id for ingredient in self.ingredients) + 1
+        response = self.author_user.post(
+            '/api/recipes/',
+            self.get_data(
+                [self.tags[0].id, 1000],
+                [self.ingredients[0].id, missing, missing + 1],
+            ),
+            format='json',
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                'tags': ['Теги не найдены: 1000.'],
+                'ingredients': [
+                    f'Ингредиенты не найдены: {missing}, {missing + 1}.',
+                ],
+            },
+        )
+
+    def test_duplicate_ingredients(self) -> None:
+        """Ингредиенты не могут повторяться в рецепте."""
+        ingredient = self.ingredients[0].id
+        response = self.author_user.post(
+            '/api/recipes/',
+            self.get_data([self.tags[0].id], [ingredient, ingredient]),
+            format='json',
+        )
+        self.assertEqual(
+            response.json(),
+            {'ingredients': ['Ингредиенты не могут повторяться в рецепте!']},
+        )
+
+
+def make_image(width: int, height: int) -> str:
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(
+            buffer.getvalue(),
+        ).decode()
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class RecipeImagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.author = mixer.blend(User)
+        cls.tag = mixer.blend('recipes.Tag')
+        cls.ingredient = mixer.blend('recipes.Ingredient')
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.author_user = APIClient()
+
+        cls.author_user.force_authenticate(cls.author)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_recipe(self, image: str):
+        return self.author_user.post(
+            '/api/recipes/',
+            {
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                'image': image,
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            },
+            format='json',
+        )
+
+    def test_renditions_created_after_upload(self) -> None:
+        """После загрузки картинки создаются её уменьшенные копии."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(make_image(1600, 800))
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(id=response.json()['id'])
+        images = self.client.get(f'/api/recipes/{recipe.id}/').json()['images']
+        self.assertEqual(
+            images.keys(),
+            settings.RECIPE_IMAGE_RENDITIONS.keys(),
+        )
+        for rendition, files in recipe.get_image_renditions().items():
+            self.assertIn('jpeg', files)
+            for extension, name in files.items():
+                with self.subTest(rendition=rendition, extension=extension):
+                    self.assertTrue(
+                        images[rendition][extension].endswith(name)
+                    )
+                    with Image.open(recipe.image.storage.open(name)) as image:
+                        self.assertLessEqual(
+                            image.size,
+                            settings.RECIPE_IMAGE_RENDITIONS[rendition],
+                        )
+
+    def test_images_empty_until_renditions_ready(self) -> None:
+        """Пока копии не созданы, ссылки на них не отдаются."""
+        response = self.create_recipe(make_image(10, 10))
+        self.assertEqual(
+            self.client.get(
+                f'/api/recipes/{response.json()["id"]}/',
+            ).json()['images'],
+            {},
+        )
+
+    def test_identical_images_stored_once(self) -> None:
+        """Одинаковые картинки хранятся в одном файле."""
+        image = make_image(20, 20)
+        names = {
+            Recipe.objects.get(
+                id=self.create_recipe(image).json()['id'],
+            ).image.name
+            for _ in range(2)
+        }
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(
+            name, r'^recipes/images/[0-9a-f]{2}/[0-9a-f]{64}\.png$'
+        )
+        directory = posixpath.dirname(name)
+        self.assertEqual(
+            Recipe._meta.get_field('image').storage.listdir(directory)[1],
+            [posixpath.basename(name)],
+        )
+
+    def test_gcmedia_deletes_orphans(self) -> None:
+        """gcmedia удаляет только файлы, на которые нет ссылок."""
+        storage = Recipe._meta.get_field('image').storage
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.create_recipe(make_image(30, 30)).json()['id']
+        recipe = Recipe.objects.get(id=recipe_id)
+        old_files = [recipe.image.name] + [
+            name
+            for files in recipe.get_image_renditions().values()
+            for name in files.values()
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author_user.patch(
+                f'/api/recipes/{recipe_id}/',
+                {
+                    'tags': [self.tag.id],
+                    'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                    'image': make_image(40, 40),
+                },
+                format='json',
+            )
+        recipe.refresh_from_db()
+        new_files = [recipe.image.name] + [
+            name
+            for files in recipe.get_image_renditions().values()
+            for name in files.values()
+        ]
+        call_command('gcmedia', '--dry-run', '--min-age=0', stdout=StringIO())
+        self.assertTrue(all(map(storage.exists, old_files)))
+        call_command('gcmedia', '--min-age=0', stdout=StringIO())
+        self.assertFalse(any(map(storage.exists, old_files)))
+        self.assertTrue(all(map(storage.exists, new_files)))
+
+    def test_reused_image_protected_from_gcmedia(self) -> None:
+        """Повторная загрузка старого файла защищает его от gcmedia."""
+        storage = Recipe._meta.get_field('image').storage
+        image = make_image(50, 50)
+        name = Recipe.objects.get(
+            id=self.create_recipe(image).json()['id'],
+        ).image.name
+        Recipe.objects.all().delete()
+        os.utime(storage.path(name), (0, 0))
+        self.assertEqual(
+            storage.save(
+                'recipes/images/image.png',
+                ContentFile(base64.b64decode(image.split(',', 1)[1])),
+            ),
+            name,
+        )
+        call_command('gcmedia', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+
+    def test_makerenditions_force(self) -> None:
+        """makerenditions --force пересоздаёт испорченные копии."""
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.create_recipe(make_image(60, 60)).json()['id']
+        recipe = Recipe.objects.get(id=recipe_id)
+        name = recipe.get_image_renditions()['thumbnail']['jpeg']
+        path = recipe.image.storage.path(name)
+        with open(path, 'wb') as file:
+            file.write(b'broken')
+        call_command('makerenditions', '--all', stdout=StringIO())
+        self.assertEqual(os.path.getsize(path), len(b'broken'))
+        call_command('makerenditions', '--force', stdout=StringIO())
+        recipe.refresh_from_db()
+        name = recipe.get_image_renditions()['thumbnail']['jpeg']
+        with Image.open(recipe.image.storage.open(name)) as image:
+            self.assertLessEqual(
+                image.size,
+                settings.RECIPE_IMAGE_RENDITIONS['thumbnail'],
+            )
+
+    def test_image_limits(self) -> None:
+        """Слишком большие и некорректные картинки отклоняются."""
+        for image, limits in (
+            (make_image(10, 10), {'RECIPE_IMAGE_MAX_SIZE': 10}),
+            (make_image(100, 100), {'RECIPE_IMAGE_MAX_PIXELS': 9999}),
+            ('data:image/png;base64,не base64', {}),
+            ('data:image/png;base64,' + 'A' * 64, {}),
+        ):
+            with self.subTest(limits=limits), self.settings(**limits):
+                response = self.create_recipe(image)
+                self.assertEqual(
+                    response.status_code,
+                    HTTPStatus.BAD_REQUEST,
+                )
+                self.assertIn('image', response.json())
+
+
+class ImportCsvTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_import_is_bulk_and_idempotent(self) -> None:
+        """Импорт идёт пачками, повторный запуск ничего не добавляет."""
+        self.assertEqual(self.client.get('/api/ingredients/').json(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                call_command(
+                    'importcsv',
+                    '--batch-size=500',
+                    stdout=StringIO(),
+                )
+        self.assertLess(len(queries), 20)
+        ingredients = self.client.get('/api/ingredients/').json()
+        self.assertEqual(len(ingredients), Ingredient.objects.count())
+        self.assertEqual(Tag.objects.count(), 3)
+        call_command(
+            'importcsv',
+            '--ingredients',
+            settings.BASE_DIR / 'static' / 'data' / 'ingredients.json',
+            stdout=StringIO(),
+        )
+        self.assertEqual(len(ingredients), Ingredient.objects.count())
+        self.assertEqual(
+            Ingredient.objects.values('name').distinct().count(),
+            Ingredient.objects.count(),
+        )
+
+    def test_import_normalizes_and_counts_created(self) -> None:
+        """Цвет тегов приводится к верхнему регистру, пропуски не считаются."""
+        mixer.blend(Tag, color='#FFFFFF', slug='white')
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'tags.json'
+            path.write_text(
+                json.dumps(
+                    [
+                        {'name': 'Обед', 'color': '#ffc71f', 'slug': 'lunch'},
+                        {'name': 'Снег', 'color': '#ffffff', 'slug': 'snow'},
+                    ],
+                ),
+                encoding='utf-8',
+            )
+            out = StringIO()
+            call_command(
+                'importcsv',
+                '--tags',
+                path,
+                '--ingredients',
+                settings.BASE_DIR / 'static' / 'data' / 'ingredients.json',
+                stdout=out,
+            )
+        self.assertEqual(Tag.objects.get(slug='lunch').color, '#FFC71F')
+        self.assertFalse(Tag.objects.filter(slug='snow').exists())
+        self.assertIn(
+            'tags.json загружены в БД! Добавлено записей: 1', out.getvalue()
+        )
+
+
+class IngredientsAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        for name in ('Сахарная пудра', 'Сахар', 'Ванильный сахар', 'Соль'):
+            mixer.blend('recipes.Ingredient', name=name)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def autocomplete(self, query: str) -> list:
+        return [
+            ingredient['name']
+            for ingredient in self.client.get(
+                f'/api/ingredients/autocomplete/?{query}',
+            ).json()
+        ]
+
+    def test_autocomplete_ranks_prefix_before_substring(self) -> None:
+        """Совпадения по началу названия идут раньше, чем по подстроке."""
+        self.assertEqual(
+            self.autocomplete('name=сах'),
+            ['Сахар', 'Сахарная пудра', 'Ванильный сахар'],
+        )
+
+    def test_autocomplete_respects_limit(self) -> None:
+        """Автодополнение возвращает не больше limit ингредиентов."""
+        self.assertEqual(self.autocomplete('name=сах&limit=1'), ['Сахар'])
+        self.assertEqual(self.autocomplete('name='), [])
+
+    def test_autocomplete_sees_new_ingredients(self) -> None:
+        """Новый ингредиент сразу попадает в автодополнение."""
+        self.autocomplete('name=соль')
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Ingredient', name='Соль морская')
+        self.assertEqual(
+            self.autocomplete('name=соль'),
+            ['Соль', 'Соль морская'],
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class RecipesSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.chicken = mixer.blend(Ingredient, name='Курица')
+        potato = mixer.blend(Ingredient, name='Картофель')
+        cls.author = mixer.blend(User)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.roast = cls.make_recipe(
+                'Курица с картофелем',
+                'Запекать в духовке.',
+                (cls.chicken, potato),
+            )
+            cls.soup = cls.make_recipe(
+                'Суп',
+                'Сварить бульон.',
+                (cls.chicken,),
+            )
+            cls.pie = cls.make_recipe(
+                'Пирог',
+                'Подавать с курицей или картофелем.',
+                (potato,),
+            )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def make_recipe(cls, name, text, ingredients):
+        recipe = mixer.blend(Recipe, author=cls.author, name=name, text=text)
+        for ingredient in ingredients:
+            IngredientInRecipe.objects.create(
+                recipe=recipe,
+                ingredient=ingredient,
+                amount=1,
+            )
+        # Ингредиенты добавлены после сохранения рецепта, как в сериализаторе.
+        recipe.save()
+        return recipe
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def search(self, query: str, **params) -> list:
+        response = self.client.get(
+            '/api/recipes/',
+            {'search': query, **params},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_search_ranks_by_field(self) -> None:
+        """Совпадение в названии выше, чем в ингредиентах и описании."""
+        self.assertEqual(
+            self.search('курица'),
+            [self.roast.id, self.soup.id, self.pie.id],
+        )
+
+    def test_search_ignores_cursor_pagination(self) -> None:
+        """С поиском курсорный режим не ломает сортировку по рангу."""
+        self.assertEqual(
+            self.search('курица', pagination='cursor'),
+            [self.roast.id, self.soup.id, self.pie.id],
+        )
+
+    def test_search_matches_word_forms(self) -> None:
+        """Поиск находит другие формы слов и требует все слова запроса."""
+        self.assertEqual(
+            self.search('курицей и картофелем'),
+            [self.roast.id, self.pie.id],
+        )
+        self.assertEqual(self.search('бульоны'), [self.soup.id])
+        self.assertEqual(self.search('рыба'), [])
+
+    def test_search_sees_updated_recipe(self) -> None:
+        """Изменённый рецепт находится по новому тексту."""
+        self.assertEqual(self.search('рыба'), [])
+        self.soup.text = 'Сварить рыбу.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.save()
+        self.assertEqual(self.search('рыба'), [self.soup.id])
+
+    def test_search_sees_renamed_ingredient(self) -> None:
+        """Переименование ингредиента меняет результаты поиска."""
+        self.chicken.name = 'Индейка'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chicken.save()
+        self.assertCountEqual(
+            self.search('индейка'),
+            [self.roast.id, self.soup.id],
+        )
+
+    def test_russian_stemmer(self) -> None:
+        """Формы одного слова сводятся к одной основе."""
+        for words in (
+            ('курица', 'курицей', 'курицу'),
+            ('картофель', 'картофелем'),
+            ('запечённая', 'запеченный'),
+            ('пирог', 'пироги'),
+        ):
+            with self.subTest(words=words):
+                self.assertEqual(len({stem(word) for word in words}), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_IMAGE_WORKERS=0)
+class WhatToCookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.egg, cls.milk, cls.flour, cls.sugar, cls.salt = mixer.cycle(
+            5,
+        ).blend(Ingredient)
+        cls.omelette = cls.make_recipe(cls.egg, cls.milk)
+        cls.pancakes = cls.make_recipe(cls.egg, cls.milk, cls.flour)
+        cls.cake = cls.make_recipe(cls.egg, cls.flour, cls.sugar, cls.salt)
+        cls.biscuits = cls.make_recipe(cls.flour, cls.salt)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def make_recipe(cls, *ingredients):
+        recipe = mixer.blend(Recipe)
+        add_tags_and_ingredients(
+            (),
+            [{'id': ingredient, 'amount': 1} for ingredient in ingredients],
+            recipe,
+        )
+        return recipe
+
+    def setUp(self) -> None:
+        cache.clear()
+        # Журнал в БД откатывается после каждого теста, поэтому индекс,
+        # оставшийся от предыдущего теста, строится заново.
+        recipe_ingredients_index._built = None
+
+    def what_to_cook(self, **params):
+        return self.client.get(
+            '/api/recipes/what_to_cook/',
+            {'ingredients': [self.egg.id, self.milk.id], **params},
+        )
+
+    def test_recipes_ranked_by_coverage(self) -> None:
+        """Рецепты сортируются по доле имеющихся ингредиентов."""
+        response = self.what_to_cook()
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [
+                (recipe['id'], recipe['covered'], recipe['missing'])
+                for recipe in response.json()['results']
+            ],
+            [
+                (self.omelette.id, 2, 0),
+                (self.pancakes.id, 2, 1),
+                (self.cake.id, 1, 3),
+            ],
+        )
+        self.assertEqual(response.json()['results'][0]['coverage'], 1.0)
+
+    def test_max_missing(self) -> None:
+        """max_missing отсекает рецепты, где не хватает больше K."""
+        for max_missing, expected in (
+            (0, [self.omelette.id]),
+            (1, [self.omelette.id, self.pancakes.id]),
+        ):
+            with self.subTest(max_missing=max_missing):
+                self.assertEqual(
+                    [
+                        recipe['id']
+                        for recipe in self.what_to_cook(
+                            max_missing=max_missing,
+                        ).json()['results']
+                    ],
+                    expected,
+                )
+
+    def test_pagination(self) -> None:
+        """Страницы выдачи идут в порядке покрытия."""
+        response = self.what_to_cook(limit=1, page=2)
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.pancakes.id],
+        )
+
+    def test_cursor_mode_ignored(self) -> None:
+        """Курсорный режим не ломает выдачу по покрытию."""
+        response = self.what_to_cook(pagination='cursor', limit=2)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.omelette.id, self.pancakes.id],
+        )
+
+    def test_invalid_params(self) -> None:
+        """Без ингредиентов или с отрицательным K возвращается 400."""
+        for params in (
+            {},
+            {'ingredients': 'egg'},
+            {'ingredients': self.egg.id, 'max_missing': -1},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    self.client.get(
+                        '/api/recipes/what_to_cook/',
+                        params,
+                    ).status_code,
+                    HTTPStatus.BAD_REQUEST,
+                )
+
+    def change_cake(self) -> None:
+        update_ingredients(
+            self.cake,
+            [{'id': self.egg, 'amount': 1}, {'id': self.milk, 'amount': 1}],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cake.save()
+            self.omelette.delete()
+
+    def assertCanCookOnlyCake(self) -> None:
+        self.assertEqual(
+            [
+                recipe['id']
+                for recipe in self.what_to_cook(max_missing=0).json()[
+                    'results'
+                ]
+            ],
+            [self.cake.id],
+        )
+
+    def test_index_follows_changes(self) -> None:
+        """Индекс обновляет изменённые и удалённые рецепты по журналу."""
+        self.what_to_cook()
+        self.change_cake()
+        with patch.object(
+            recipe_ingredients_index,
+            'rebuild',
+            wraps=recipe_ingredients_index.rebuild,
+        ) as rebuild:
+            self.assertCanCookOnlyCake()
+        rebuild.assert_not_called()
+
+    def test_pruned_journal_rebuilds_index(self) -> None:
+        """Без нужных записей журнала индекс строится заново."""
+        self.what_to_cook()
+        self.change_cake()
+        IngredientsIndexChange.objects.all().delete()
+        with patch.object(
+            recipe_ingredients_index,
+            'rebuild',
+            wraps=recipe_ingredients_index.rebuild,
+        ) as rebuild:
+            self.assertCanCookOnlyCake()
+        rebuild.assert_called_once()
+
+    def test_rebuild_does_not_block_readers(self) -> None:
+        """Индекс читается из БД без блокировки других потоков."""
+        values_list = IngredientInRecipe.objects.values_list
+        locked = []
+
+        def read_index(*args, **kwargs):
+            locked.append(recipe_ingredients_index._lock.locked())
+            return values_list(*args, **kwargs)
+
+        with patch.object(
+            IngredientInRecipe.objects,
+            'values_list',
+            side_effect=read_index,
+        ):
+            self.what_to_cook()
+        self.assertEqual(locked, [False])
+
+
+class CatalogsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.tag = mixer.blend('recipes.Tag')
+        cls.ingredient = mixer.blend('recipes.Ingredient')
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_catalogs_do_not_query_database(self) -> None:
+        """Повторные запросы к справочникам не обращаются к БД."""
+        urls = (
+            '/api/tags/',
+            f'/api/tags/{self.tag.id}/',
+            '/api/ingredients/',
+            f'/api/ingredients/{self.ingredient.id}/',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    self.assertEqual(
+                        self.client.get(url).status_code,
+                        HTTPStatus.OK,
+                    )
+
+    def test_catalog_etag_revalidation(self) -> None:
+        """Справочник отдаёт 304, пока он не изменился."""
+        etag = self.client.get('/api/tags/')['ETag']
+        self.assertEqual(
+            self.client.get(
+                '/api/tags/',
+                HTTP_IF_NONE_MATCH=etag,
+            ).status_code,
+            HTTPStatus.NOT_MODIFIED,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Tag')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_catalog_bumped_after_commit(self) -> None:
+        """Версия справочника и метка меняются после фиксации транзакции."""
+        version = tags_catalog.get_version()
+        stamp = get_stamp(RECIPES_STAMP_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Tag')
+            self.assertEqual(tags_catalog.get_version(), version)
+            self.assertEqual(get_stamp(RECIPES_STAMP_KEY), stamp)
+        self.assertNotEqual(tags_catalog.get_version(), version)
+        self.assertNotEqual(get_stamp(RECIPES_STAMP_KEY), stamp)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipesConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.recipe = mixer.blend('recipes.Recipe')
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_recipe_detail_revalidation(self) -> None:
+        """Рецепт отдаёт 304, пока не изменились он сам и флаги."""
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.authorized_user.get(url)
+        self.assertIn('Last-Modified', response)
+        for header, value in (
+            ('HTTP_IF_NONE_MATCH', response['ETag']),
+            ('HTTP_IF_MODIFIED_SINCE', response['Last-Modified']),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(
+                    self.authorized_user.get(
+                        url, **{header: value}
+                    ).status_code,
+                    HTTPStatus.NOT_MODIFIED,
+                )
+        self.authorized_user.post(f'{url}favorite/')
+        response = self.authorized_user.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.json()['is_favorited'])
+
+    def test_recipe_list_revalidation(self) -> None:
+        """Список рецептов отдаёт 304, пока в нём ничего не изменилось."""
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.assertEqual(
+            self.client.get(
+                '/api/recipes/',
+                HTTP_IF_NONE_MATCH=etag,
+            ).status_code,
+            HTTPStatus.NOT_MODIFIED,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Recipe')
+        self.assertEqual(
+            self.client.get(
+                '/api/recipes/',
+                HTTP_IF_NONE_MATCH=etag,
+            ).status_code,
+            HTTPStatus.OK,
+        )
+
+    def test_changes_within_one_second(self) -> None:
+        """Изменение в ту же секунду меняет ETag списка."""
+        second = int(time.time()) + 60
+        with patch(
+            'core.stamps.time.time',
+            side_effect=(second + step / 100 for step in range(1, 100)),
+        ):
+            response = self.authorized_user.get('/api/recipes/')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.authorized_user.post(
+                    f'/api/recipes/{self.recipe.id}/favorite/',
+                )
+            revalidated = self.authorized_user.get(
+                '/api/recipes/',
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(
+            revalidated['Last-Modified'], response['Last-Modified']
+        )
+        self.assertEqual(revalidated.status_code, HTTPStatus.OK)
+        self.assertTrue(revalidated.json()['results'][0]['is_favorited'])
+
+    def test_list_without_full_count(self) -> None:
+        """Список проверяется по меткам, число рецептов берётся из кэша."""
+        url = '/api/recipes/'
+        etag = self.authorized_user.get(url)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_user.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(context), 0)
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_user.get(url)
+        self.assertFalse(
+            [
+                query['sql']
+                for query in context.captured_queries
+                if 'COUNT(' in query['sql']
+            ],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Recipe')
+        self.assertEqual(self.authorized_user.get(url).json()['count'], 2)
+
+    def test_cursor_list_revalidation(self) -> None:
+        """В курсорном режиме 304 отдаётся без подсчёта всей выборки."""
+        url = '/api/recipes/?pagination=cursor'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(context), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            mixer.blend('recipes.Recipe')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.OK,
+        )
+
+    def test_author_change_invalidates_recipes(self) -> None:
+        """Изменение профиля автора не даёт 304 со старым именем."""
+        author = self.recipe.author
+        author_client = APIClient()
+        author_client.force_authenticate(author)
+        urls = (
+            '/api/recipes/',
+            '/api/recipes/?pagination=cursor',
+            f'/api/recipes/{self.recipe.id}/',
+        )
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            author_client.patch(
+                '/api/users/me/',
+                {'first_name': 'Новое имя'},
+            )
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('Новое имя', response.content.decode())
+
+    def test_etag_depends_on_user(self) -> None:
+        """ETag пользователя не подходит анонимному клиенту."""
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                response = self.authorized_user.get(url)
+                self.assertEqual(
+                    self.client.get(
+                        url,
+                        HTTP_IF_NONE_MATCH=response['ETag'],
+                    ).status_code,
+                    HTTPStatus.OK,
+                )
+                self.assertIn('Authorization', response['Vary'])
+                self.assertIn('Cookie', response['Vary'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipesRelationFiltersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.favorite, cls.in_cart, cls.other = mixer.cycle(3).blend(
+            'recipes.Recipe',
+        )
+        mixer.blend('recipes.Favorite', user=cls.user, recipe=cls.favorite)
+        mixer.blend('recipes.ShoppingCart', user=cls.user, recipe=cls.in_cart)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get_ids(self, client: APIClient, query: str) -> set:
+        response = client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return {recipe['id'] for recipe in response.json()['results']}
+
+    def test_relation_filters(self) -> None:
+        """Фильтры is_favorited и is_in_shopping_cart работают корректно."""
+        queries_expected = (
+            ('is_favorited=1', {self.favorite.id}),
+            ('is_favorited=0', {self.in_cart.id, self.other.id}),
+            ('is_in_shopping_cart=1', {self.in_cart.id}),
+            ('is_in_shopping_cart=0', {self.favorite.id, self.other.id}),
+            ('is_favorited=0&is_in_shopping_cart=0', {self.other.id}),
+        )
+        for query, expected in queries_expected:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.get_ids(self.authorized_user, query),
+                    expected,
+                )
+
+    def test_anon_relation_filters(self) -> None:
+        """Анонимный пользователь может использовать фильтры по связям."""
+        everything = {self.favorite.id, self.in_cart.id, self.other.id}
+        for param in ('is_favorited', 'is_in_shopping_cart'):
+            with self.subTest(param=param):
+                self.assertEqual(
+                    self.get_ids(self.client, f'{param}=0'),
+                    everything,
+                )
+                with self.assertNumQueries(0):
+                    self.assertEqual(
+                        self.get_ids(self.client, f'{param}=1'),
+                        set(),
+                    )
+
+    def test_relation_filters_use_index(self) -> None:
+        """Анти-соединение по избранному и списку покупок идёт по индексу."""
+        for model in (Favorite, ShoppingCart):
+            with self.subTest(model=model.__name__):
+                plan = self.explain(
+                    Recipe.objects.filter_by_relation(model, self.user, False),
+                )
+                if connection.vendor == 'postgresql':
+                    self.assertNotIn(
+                        f'Seq Scan on {model._meta.db_table}', plan
+                    )
+                    self.assertIn('Index', plan)
+                else:
+                    self.assertRegex(
+                        plan, r'SEARCH \w+ USING (COVERING )?INDEX'
+                    )
+
+    def explain(self, queryset) -> str:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user, cls.author = mixer.cycle(2).blend(User)
+        cls.recipe = mixer.blend('recipes.Recipe', author=cls.author)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def assertCounters(
+        self,
+        favorites_count: int,
+        recipes_count: int,
+        followers_count: int,
+    ) -> None:
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, favorites_count)
+        self.assertEqual(self.author.recipes_count, recipes_count)
+        self.assertEqual(self.author.followers_count, followers_count)
+
+    def test_counters_follow_changes(self) -> None:
+        """Счётчики меняются вместе с избранным, рецептами и подписками."""
+        self.assertCounters(0, 1, 0)
+        self.authorized_user.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.authorized_user.post(f'/api/users/{self.author.id}/subscribe/')
+        mixer.blend('recipes.Recipe', author=self.author)
+        self.assertCounters(1, 2, 1)
+        self.authorized_user.delete(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.authorized_user.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(0, 2, 0)
+
+    def test_repeated_toggles(self) -> None:
+        """Повторное добавление и удаление не меняют счётчики дважды."""
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        statuses = [
+            self.authorized_user.post(url).status_code,
+            self.authorized_user.post(url).status_code,
+        ]
+        self.assertCounters(1, 1, 0)
+        statuses += [
+            self.authorized_user.delete(url).status_code,
+            self.authorized_user.delete(url).status_code,
+        ]
+        self.assertCounters(0, 1, 0)
+        self.assertEqual(
+            statuses,
+            [
+                HTTPStatus.CREATED,
+                HTTPStatus.BAD_REQUEST,
+                HTTPStatus.NO_CONTENT,
+                HTTPStatus.BAD_REQUEST,
+            ],
+        )
+        self.assertEqual(
+            self.authorized_user.delete(
+                f'/api/recipes/{self.recipe.id + 1}/favorite/',
+            ).status_code,
+            HTTPStatus.NOT_FOUND,
+        )
+
+    def test_saves_keep_counters(self) -> None:
+        """Сохранение профиля и рецепта не затирает счётчики."""
+        author_client = APIClient()
+        author_client.force_authenticate(self.author)
+        self.authorized_user.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.authorized_user.post(f'/api/users/{self.author.id}/subscribe/')
+        # В памяти клиента автора остались значения счётчиков до подписки.
+        self.assertEqual(
+            author_client.patch(
+                '/api/users/me/',
+                {'first_name': 'Новое имя'},
+            ).status_code,
+            HTTPStatus.OK,
+        )
+        self.assertCounters(1, 1, 1)
+        self.assertEqual(self.author.first_name, 'Новое имя')
+        recipe = Recipe.objects.get(id=self.recipe.id)
+        Recipe.objects.filter(id=recipe.id).update(favorites_count=7)
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 7)
+        self.assertEqual(self.recipe.name, 'Новое название')
+
+    def test_recount_command(self) -> None:
+        """Команда recount исправляет расхождения в счётчиках."""
+        mixer.blend('recipes.Favorite', user=self.user, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=5)
+        User.objects.update(recipes_count=5, followers_count=5)
+        call_command('recount', stdout=StringIO())
+        self.assertCounters(1, 1, 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RelationsBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.recipes = mixer.cycle(6).blend('recipes.Recipe')
+        cls.ingredient = mixer.blend('recipes.Ingredient')
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=cls.ingredient,
+                amount=10,
+            )
+            for recipe in cls.recipes
+        )
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+        cls.anon = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def bulk(self, method: str, relation: str, recipes: list) -> list:
+        return getattr(self.authorized_user, method)(
+            f'/api/recipes/{relation}/bulk/',
+            {'ids': [recipe.id for recipe in recipes]},
+            format='json',
+        ).json()
+
+    def test_bulk_outcomes(self) -> None:
+        """Массовые действия возвращают результат для каждого id."""
+        first, second = self.recipes[:2]
+        mixer.blend('recipes.Favorite', user=self.user, recipe=first)
+        missing = Recipe(id=max(recipe.id for recipe in self.recipes) + 1)
+        self.assertEqual(
+            self.bulk('post', 'favorite', [first, second, missing]),
+            [
+                {'id': first.id, 'status': 'exists'},
+                {'id': second.id, 'status': 'added'},
+                {'id': missing.id, 'status': 'not_found'},
+            ],
+        )
+        self.assertEqual(
+            self.bulk('delete', 'favorite', [second, self.recipes[2]]),
+            [
+                {'id': second.id, 'status': 'deleted'},
+                {'id': self.recipes[2].id, 'status': 'missing'},
+            ],
+        )
+        self.assertEqual(
+            list(
+                Favorite.objects.filter(user=self.user).values_list(
+                    'recipe',
+                    flat=True,
+                ),
+            ),
+            [first.id],
+        )
+        self.assertEqual(
+            list(
+                Recipe.objects.filter(id__in=(first.id, second.id))
+                .order_by('id')
+                .values_list('favorites_count', flat=True),
+            ),
+            [1, 0],
+        )
+
+    def test_bulk_shopping_cart_totals(self) -> None:
+        """Массовое изменение корзины поддерживает итоги списка покупок."""
+        self.bulk('post', 'shopping_cart', self.recipes)
+        self.assertEqual(
+            ShoppingCartTotal.objects.get(user=self.user).total,
+            10 * len(self.recipes),
+        )
+        self.bulk('delete', 'shopping_cart', self.recipes[:4])
+        self.assertEqual(
+            ShoppingCartTotal.objects.get(user=self.user).total,
+            10 * (len(self.recipes) - 4),
+        )
+        self.bulk('delete', 'shopping_cart', self.recipes)
+        self.assertFalse(ShoppingCartTotal.objects.exists())
+
+    def test_bulk_without_returning(self) -> None:
+        """Без RETURNING массовые действия дают тот же результат."""
+        with patch('core.relations.supports_returning', return_value=False):
+            self.test_bulk_outcomes()
+            self.test_bulk_shopping_cart_totals()
+
+    def test_bulk_queries_do_not_depend_on_ids_count(self) -> None:
+        """Число запросов массового действия не зависит от числа id."""
+        queries = []
+        for recipes in (self.recipes[:1], self.recipes[1:]):
+            for method in ('post', 'delete'):
+                with CaptureQueriesContext(connection) as context:
+                    self.bulk(method, 'shopping_cart', recipes)
+                queries.append(len(context))
+        self.assertEqual(queries[:2], queries[2:])
+
+    def test_bulk_validation(self) -> None:
+        """Список id проверяется, аноним не может менять связи."""
+        for data in ({}, {'ids': []}, {'ids': ['x']}, {'ids': [0]}):
+            with self.subTest(data=data):
+                self.assertEqual(
+                    self.authorized_user.post(
+                        '/api/recipes/favorite/bulk/',
+                        data,
+                        format='json',
+                    ).status_code,
+                    HTTPStatus.BAD_REQUEST,
+                )
+        self.assertEqual(
+            self.anon.post(
+                '/api/recipes/favorite/bulk/',
+                {'ids': [self.recipes[0].id]},
+                format='json',
+            ).status_code,
+            HTTPStatus.UNAUTHORIZED,
+        )
+
+
+@skipIf(
+    connection.vendor == 'sqlite',
+    'SQLite не поддерживает параллельную запись из нескольких потоков',
+)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RelationTogglesRaceTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self) -> None:
+        self.user, self.author = mixer.cycle(2).blend(User)
+        self.recipe = mixer.blend('recipes.Recipe', author=self.author)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def run_concurrently(self, method: str, *urls: str) -> list:
+        if len(urls) == 1:
+            urls *= self.THREADS
+        barrier = Barrier(len(urls))
+        statuses = []
+
+        def request(url: str) -> None:
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=request, args=(url,)) for url in urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_concurrent_favorite_toggles(self) -> None:
+        """Параллельные запросы добавляют и удаляют избранное один раз."""
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(
+            self.run_concurrently('post', url),
+            [HTTPStatus.CREATED]
+            + [HTTPStatus.BAD_REQUEST] * (self.THREADS - 1),
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(
+            self.run_concurrently('delete', url),
+            [HTTPStatus.NO_CONTENT]
+            + [HTTPStatus.BAD_REQUEST] * (self.THREADS - 1),
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(Favorite.objects.exists())
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_concurrent_first_cart_additions(self) -> None:
+        """Параллельное добавление рецептов с общим ингредиентом в корзину."""
+        ingredient = mixer.blend(Ingredient)
+        recipes = mixer.cycle(self.THREADS).blend(
+            'recipes.Recipe',
+            author=self.author,
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=2)
+            for recipe in recipes
+        )
+        self.assertEqual(
+            self.run_concurrently(
+                'post',
+                *(
+                    f'/api/recipes/{recipe.id}/shopping_cart/'
+                    for recipe in recipes
+                ),
+            ),
+            [HTTPStatus.CREATED] * self.THREADS,
+        )
+        self.assertEqual(
+            ShoppingCartTotal.objects.get(
+                user=self.user,
+                ingredient=ingredient,
+            ).total,
+            2 * self.THREADS,
+        )
+
+
+@override_settings(DB_CONN_HEALTH_CHECK_IDLE=10)
+class DbConnectionsHealthCheckTests(TestCase):
+    def test_unusable_connection_closed_before_request(self) -> None:
+        """Неработающее простаивавшее соединение закрывается до запроса."""
+        for usable, health_checks, idle, errors, checked, closed in (
+            (True, True, 60, False, True, False),
+            (False, True, 60, False, True, True),
+            (False, False, 60, False, False, False),
+            (False, True, 1, False, False, False),
+            (False, True, 1, True, True, True),
+        ):
+            with self.subTest(
+                usable=usable,
+                health_checks=health_checks,
+                idle=idle,
+                errors=errors,
+            ):
+                with self.settings(
+                    DB_CONN_HEALTH_CHECKS=health_checks,
+                ), patch.object(
+                    connection,
+                    'last_request_finished',
+                    time.monotonic() - idle,
+                    create=True,
+                ), patch.object(
+                    connection,
+                    'errors_occurred',
+                    errors,
+                ), patch.object(
+                    connection,
+                    'is_usable',
+                    return_value=usable,
+                ) as is_usable, patch.object(
+                    connection,
+                    'close',
+                ) as close:
+                    check_db_connections(sender=self.__class__)
+                self.assertEqual(is_usable.called, checked)
+                self.assertEqual(close.called, closed)
+
+    def test_finished_request_marks_connection_idle(self) -> None:
+        """После запроса соединение до истечения простоя не проверяется."""
+        with patch.object(
+            connection,
+            'last_request_finished',
+            0,
+            create=True,
+        ), patch.object(connection, 'is_usable') as is_usable:
+            self.client.get('/api/tags/')
+            is_usable.reset_mock()
+            check_db_connections(sender=self.__class__)
+        self.assertFalse(is_usable.called)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class AsyncReadViewsTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = mixer.blend(User)
+        self.tag = mixer.blend(Tag)
+        self.recipes = mixer.cycle(3).blend(
+            Recipe,
+            author=self.user,
+            tags=[self.tag],
+        )
+        self.client = APIClient()
+        self.factory = APIRequestFactory()
+        self.view = async_read_view(
+            RecipeAPIView.as_view({'get': 'list', 'post': 'create'}),
+        )
+
+    def test_read_matches_sync_view(self) -> None:
+        """Асинхронное представление отдаёт тот же список рецептов."""
+        response = async_to_sync(self.view)(self.factory.get('/api/recipes/'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            json.loads(response.content),
+            self.client.get('/api/recipes/').json(),
+        )
+
+    def test_write_runs_in_sync_thread(self) -> None:
+        """Пишущие запросы выполняются в общем синхронном потоке."""
+        with patch(
+            'core.async_views.run_read_view',
+            side_effect=AssertionError,
+        ):
+            response = async_to_sync(self.view)(
+                self.factory.post('/api/recipes/', {}, format='json'),
+            )
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_async_urls(self) -> None:
+        """Маршруты чтения заменяются асинхронными представлениями."""
+        urls = async_read_urls(router.urls, ('recipes-list', 'tags-detail'))
+        wrapped = {
+            url.name
+            for url in urls
+            if asyncio.iscoroutinefunction(getattr(url, 'callback', None))
+        }
+        self.assertEqual(wrapped, {'recipes-list', 'tags-detail'})
+
+
+@skipIf(
+    connection.vendor not in ('sqlite', 'postgresql'),
+    'Планы запросов разбираются только для SQLite и PostgreSQL',
+)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryPlansTests(TestCase):
+    """Частые запросы API не читают таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@foodgram.ru')
+            for number in range(30)
+        )
+        users = list(User.objects.all())
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(100)
+        )
+        ingredients = list(Ingredient.objects.all())
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(5)
+        )
+        tags = list(Tag.objects.all())
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'рецепт {number}',
+                text='описание',
+                cooking_time=10,
+                author=users[number % len(users)],
+                image='recipes/images/recipe.jpg',
+            )
+            for number in range(1000)
+        )
+        recipes = list(Recipe.objects.all())
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=1,
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(5)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tags[number % len(tags)])
+            for number, recipe in enumerate(recipes)
+        )
+        for number, user in enumerate(users):
+            Favorite.objects.bulk_create(
+                Favorite(user=user, recipe=recipe)
+                for recipe in recipes[number::100]
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe=recipe)
+                for recipe in recipes[number::300]
+            )
+            Subscribe.objects.bulk_create(
+                Subscribe(
+                    user=user,
+                    following=users[(number + shift) % len(users)],
+                )
+                for shift in range(1, 6)
+            )
+        call_command('rebuildcarttotals', stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[0]
+        cls.recipe = Recipe.objects.filter(author=cls.user).first()
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def explain(self, sql: str) -> list:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[3] for row in cursor.fetchall()]
+            # Без запрета PostgreSQL читает маленькие таблицы целиком, даже
+            # когда подходящий индекс есть.
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+    def get_full_scans(self, sql: str, plan: list) -> list:
+        """Строки плана, в которых таблица или индекс читаются целиком.
+
+        Поиск по ключу SQLite помечает как SEARCH, а PostgreSQL - строкой
+        Index Cond под узлом Index Scan. Обход индекса в порядке сортировки
+        допустим только в запросах с LIMIT: он останавливается на первых
+        строках страницы.
+        """
+        limited = re.search(r' LIMIT \d+(?: OFFSET \d+)?$', sql)
+        scans = []
+        for number, line in enumerate(plan):
+            line = line.strip()
+            if line.startswith('SCAN ') or 'Seq Scan on ' in line:
+                ordered = line.startswith('SCAN ') and ' INDEX ' in line
+            elif 'Index Scan' in line or 'Index Only Scan' in line:
+                node = takewhile(
+                    lambda child: '->' not in child,
+                    islice(plan, number + 1, None),
+                )
+                if any('Index Cond: ' in child for child in node):
+                    continue
+                ordered = True
+            else:
+                continue
+            if not (ordered and limited):
+                scans.append(line)
+        return scans
+
+    def assertNoFullScans(self, context) -> None:
+        for query in context.captured_queries:
+            if not query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            plan = self.explain(query['sql'])
+            with self.subTest(query=query['sql']):
+                self.assertFalse(
+                    self.get_full_scans(query['sql'], plan),
+                    '\n'.join(plan),
+                )
+
+    def test_read_queries_use_indexes(self) -> None:
+        """Списки, фильтры и подписки выбираются по индексам."""
+        urls = (
+            '/api/recipes/',
+            '/api/recipes/?pagination=cursor',
+            f'/api/recipes/?author={self.user.id}',
+            f'/api/recipes/?author={self.user.id}&pagination=cursor',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?tags=tag1',
+            f'/api/recipes/{self.recipe.id}/',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/download_shopping_cart/',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Справочники загружаются целиком один раз, поэтому
+                # проверяется повторный запрос.
+                self.authorized_user.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.authorized_user.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertNoFullScans(context)
+
+    def test_delete_uses_indexes(self) -> None:
+        """Связи удаляемого рецепта находятся по индексам."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_user.delete(
+                f'/api/recipes/{self.recipe.id}/',
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertNoFullScans(context)
@@ -1,14 +1,32 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
 from api.views import IngredientAPIView, RecipeAPIView, TagAPIView
+from core.async_views import async_read_urls
 
 router = routers.DefaultRouter()
 router.register('tags', TagAPIView, basename='tags')
 router.register('ingredients', IngredientAPIView, basename='ingredients')
 router.register('recipes', RecipeAPIView, basename='recipes')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(
+        router_urls,
+        (
+            'tags-list',
+            'tags-detail',
+            'ingredients-list',
+            'ingredients-detail',
+            'ingredients-autocomplete',
+            'recipes-list',
+            'recipes-detail',
+            'recipes-what-to-cook',
+        ),
+    )
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('users.urls')),
 ]
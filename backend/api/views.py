@@ -1,97 +1,247 @@
-import csv
-from functools import reduce
-from operator import or_
+from functools import partial
+from hashlib import md5
+from itertools import chain
 
-from django.db.models import Q, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from api.mixins import CRUDAPIView, ListRetrieveAPIView
+from api.catalogs import ingredients_catalog, tags_catalog
+from api.mixins import (
+    CatalogAPIView,
+    ConditionalResponseMixin,
+    CRUDAPIView,
+)
 from api.permissions import AuthorCanEditAndDelete
+from api.renderers import (
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartTXTRenderer,
+)
 from api.serializers import (
     IngredientSerializer,
+    IngredientsOnHandSerializer,
+    RecipeCoverageSerializer,
     RecipeReadOnlySerializer,
     RecipeSerializer,
     TagSerializer,
 )
-from core.paginations import LimitPagination
-from core.utils import add_delete_object
+from core.paginations import LimitPagination, SwitchablePagination
+from core.stamps import RECIPES_STAMP_KEY, get_stamp, user_stamp_key
+from core.utils import add_delete_object, bulk_add_delete_objects
+from recipes.coverage import recipe_ingredients_index
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingCartTotal,
     Tag,
 )
+from recipes.search import search_recipes
 
 
-class TagAPIView(ListRetrieveAPIView):
+class TagAPIView(CatalogAPIView):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    catalog = tags_catalog
 
 
-class IngredientAPIView(ListRetrieveAPIView):
+class IngredientAPIView(CatalogAPIView):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+    catalog = ingredients_catalog
 
+    def filter_catalog(self, snapshot):
+        name = self.request.query_params.get(api_settings.SEARCH_PARAM)
+        if name:
+            return snapshot.index.prefix(name)
+        return snapshot.items
+
+    @action(
+        methods=('GET',),
+        detail=False,
+    )
+    def autocomplete(self, request):
+        limit = request.query_params.get('limit', '')
+        if not limit.isdigit():
+            limit = settings.NUM_OBJECTS_IN_AUTOCOMPLETE
+        snapshot = self.catalog.load()
+        return self.get_catalog_response(
+            request,
+            snapshot,
+            lambda: snapshot.index.search(
+                request.query_params.get(api_settings.SEARCH_PARAM, ''),
+                int(limit),
+            ),
+        )
 
-class RecipeAPIView(CRUDAPIView):
-    pagination_class = LimitPagination
+
+class RecipeAPIView(ConditionalResponseMixin, CRUDAPIView):
+    pagination_class = SwitchablePagination
     permission_classes = (
         IsAuthenticatedOrReadOnly,
         AuthorCanEditAndDelete,
     )
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ('author',)
+    vary_headers = ('Authorization', 'Cookie')
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request,
+            response,
+            *args,
+            **kwargs,
+        )
+        # Ошибки выгрузки списка покупок отдаются в JSON, а не в формате
+        # файла, который запросил клиент.
+        error_renderer_class = getattr(
+            getattr(response, 'accepted_renderer', None),
+            'error_renderer_class',
+            None,
+        )
+        if error_renderer_class is not None and response.status_code >= 400:
+            response.accepted_renderer = error_renderer_class()
+            response.accepted_media_type = error_renderer_class.media_type
+        return response
+
+    def get_validators(self, last_modified, *state):
+        """Возвращает ETag и Last-Modified ответа.
+
+        ETag строится по точным меткам времени и пользователю: флаги
+        is_favorited и is_in_shopping_cart у каждого свои, а изменения в
+        пределах одной секунды не должны давать 304. Last-Modified в HTTP
+        передаётся с точностью до секунды.
+        """
+        user = self.request.user
+        stamps = [get_stamp(RECIPES_STAMP_KEY)]
+        if user.is_authenticated:
+            stamps.append(get_stamp(user_stamp_key(user.id)))
+        if last_modified is not None:
+            stamps.append(last_modified.timestamp())
+        changed = max(stamps)
+        state += (
+            changed,
+            user.id if user.is_authenticated else 'anon',
+            tags_catalog.get_version(),
+            ingredients_catalog.get_version(),
+        )
+        return f'"{md5(repr(state).encode()).hexdigest()}"', int(changed)
+
+    def list(self, request, *args, **kwargs):
+        # Список проверяется только по меткам: метка рецептов обновляется
+        # при каждом изменении рецептов, тегов, ингредиентов и авторов, а
+        # метка пользователя - при изменении его избранного, корзины и
+        # подписок. Число рецептов и даты изменения не считаются.
+        etag, last_modified = self.get_validators(None)
+        self.count_cache_key = self.get_count_cache_key(etag)
+        return self.get_conditional_response(
+            request,
+            partial(super().list, request, *args, **kwargs),
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    def get_count_cache_key(self, etag):
+        """Ключ кэша для числа рецептов в списке.
+
+        Число зависит от тех же меток, что и ETag, и от фильтров запроса.
+        Результаты поиска зависят ещё и от поискового индекса, поэтому
+        для них число не кэшируется.
+        """
+        params = self.request.query_params
+        if params.get('search', '').strip():
+            return None
+        pages = (
+            self.paginator.page_query_param,
+            self.paginator.page_size_query_param,
+        )
+        filters = sorted(
+            (param, value)
+            for param, values in params.lists()
+            if param not in pages
+            for value in values
+        )
+        state = md5(repr((etag, filters)).encode()).hexdigest()
+        return f'count:recipes:{state}'
+
+    def retrieve(self, request, *args, **kwargs):
+        state = get_object_or_404(
+            Recipe.objects.with_user_flags(request.user).values(
+                'created',
+                'modified',
+                'is_favorited',
+                'is_in_shopping_cart',
+            ),
+            pk=kwargs['pk'],
+        )
+        etag, last_modified = self.get_validators(
+            state['modified'] or state['created'],
+            state['is_favorited'],
+            state['is_in_shopping_cart'],
+        )
+        return self.get_conditional_response(
+            request,
+            partial(super().retrieve, request, *args, **kwargs),
+            etag=etag,
+            last_modified=last_modified,
+        )
+
     def get_serializer_class(self):
+        if self.action == 'what_to_cook':
+            return RecipeCoverageSerializer
         if self.action == 'list' or self.action == 'retrieve':
             return RecipeReadOnlySerializer
         return RecipeSerializer
 
+    def filter_recipes(self, queryset):
+        """Применяет фильтры списка рецептов из параметров запроса."""
+        for param, model in (
+            ('is_favorited', Favorite),
+            ('is_in_shopping_cart', ShoppingCart),
+        ):
+            value = self.request.query_params.get(param)
+            if value is not None:
+                queryset = queryset.filter_by_relation(
+                    model,
+                    self.request.user,
+                    value == '1',
+                )
+        tags = self.request.query_params.getlist('tags')
+        if tags:
+            queryset = queryset.filter(
+                id__in=Recipe.tags.through.objects.filter(
+                    tag__in=tags_catalog.load().get_ids(tags),
+                ).values('recipe'),
+            )
+        search = self.request.query_params.get('search', '').strip()
+        if search and self.action == 'list':
+            queryset = search_recipes(queryset, search)
+        return queryset
+
     def get_queryset(self):
         queryset = Recipe.objects.all()
+        if self.action == 'what_to_cook':
+            return queryset.for_listing(self.request.user)
         if self.action == 'list' or self.action == 'retrieve':
-            is_favorited = self.request.query_params.get('is_favorited')
-            if is_favorited is not None:
-                queryset = (
-                    queryset.filter(favorite__user=self.request.user)
-                    if is_favorited == '1'
-                    else queryset.filter(
-                        ~Q(favorite__user=self.request.user),
-                    )
-                )
-            is_in_shopping_cart = self.request.query_params.get(
-                'is_in_shopping_cart',
+            queryset = self.filter_recipes(
+                queryset.for_listing(self.request.user),
             )
-            if is_in_shopping_cart is not None:
-                queryset = (
-                    queryset.filter(shoppingcart__user=self.request.user)
-                    if is_in_shopping_cart == '1'
-                    else queryset.filter(
-                        ~Q(shoppingcart__user=self.request.user),
-                    )
-                )
-            tags = self.request.query_params.getlist('tags')
-            if tags:
-                queryset = queryset.filter(
-                    reduce(or_, [Q(tags__slug=tag) for tag in tags]),
-                ).distinct()
         return queryset
 
     @action(
@@ -108,38 +258,94 @@ class RecipeAPIView(CRUDAPIView):
     def shopping_cart(self, request, pk):
         return add_delete_object(request, pk, ShoppingCart, 'список покупок')
 
+    @action(
+        methods=('POST', 'DELETE'),
+        detail=False,
+        url_path='favorite/bulk',
+    )
+    def favorite_bulk(self, request):
+        return bulk_add_delete_objects(
+            request,
+            Favorite,
+            'recipe',
+            Recipe.objects.all(),
+        )
+
+    @action(
+        methods=('POST', 'DELETE'),
+        detail=False,
+        url_path='shopping_cart/bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        return bulk_add_delete_objects(
+            request,
+            ShoppingCart,
+            'recipe',
+            Recipe.objects.all(),
+        )
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        # Порядок задаёт индекс покрытия, курсор по (-created, id) к нему
+        # не применим.
+        pagination_class=LimitPagination,
+    )
+    def what_to_cook(self, request):
+        params = IngredientsOnHandSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            recipe_ingredients_index.coverage(
+                params.validated_data['ingredients'],
+                params.validated_data.get('max_missing'),
+            ),
+        )
+        recipes = self.get_queryset().in_bulk(row['recipe'] for row in page)
+        page_recipes = []
+        for row in page:
+            recipe = recipes.get(row['recipe'])
+            if recipe is None:
+                continue
+            recipe.covered = row['covered']
+            recipe.missing = row['missing']
+            recipe.coverage = row['coverage']
+            page_recipes.append(recipe)
+        serializer = self.get_serializer(page_recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=('GET',),
         detail=False,
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingCartCSVRenderer,
+            ShoppingCartTXTRenderer,
+            ShoppingCartJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        recipe = ShoppingCart.objects.filter(user=user).values('recipe')
-        if not recipe.exists():
+        ingredients = (
+            ShoppingCartTotal.objects.filter(user=request.user)
+            .values(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'total',
+            )
+            .order_by('ingredient__name')
+            .iterator()
+        )
+        first_ingredient = next(ingredients, None)
+        if first_ingredient is None:
             return Response(
                 {'error': 'Список покупок пуст!'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        ingredients = (
-            IngredientInRecipe.objects.filter(
-                recipe__in=recipe,
-            )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total=Sum('amount'))
-        )
-        response = HttpResponse(content_type='text/csv')
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename=shopping_cart.csv'
-        writer = csv.writer(response)
-        writer.writerow(['Ингредиент', 'Количество', 'Единица измерения'])
-        for ingredient in ingredients:
-            _ = writer.writerow(
-                [
-                    ingredient['ingredient__name'],
-                    ingredient['total'],
-                    ingredient['ingredient__measurement_unit'],
-                ],
-            )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain((first_ingredient,), ingredients)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_cart.{renderer.format}'
+        )
         return response
@@ -0,0 +1,65 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def run_read_view(view, request, *args, **kwargs):
+    """Выполняет представление в потоке пула и отрисовывает ответ.
+
+    У каждого потока пула своё соединение с БД, поэтому старые и
+    неработающие соединения закрываются здесь, а не обработчиком
+    сигналов запроса, который работает в другом потоке.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Асинхронная обёртка над синхронным представлением.
+
+    Под ASGI синхронные представления Django выполняются по очереди в
+    одном потоке. Читающие запросы эта обёртка выполняет в общем пуле
+    потоков, поэтому медленный запрос к БД не задерживает остальные.
+    Пишущие запросы по-прежнему выполняются синхронно, в одном потоке.
+    """
+    read = sync_to_async(
+        run_read_view,
+        thread_sensitive=False,
+    )
+    write = sync_to_async(view)
+
+    async def wrapper(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await read(view, request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view, 'csrf_exempt', False)
+    wrapper.cls = getattr(view, 'cls', None)
+    wrapper.initkwargs = getattr(view, 'initkwargs', None)
+    wrapper.actions = getattr(view, 'actions', None)
+    return wrapper
+
+
+def async_read_urls(urls, names):
+    """Заменяет представления маршрутов с заданными именами обёртками."""
+    return [
+        (
+            URLPattern(
+                url.pattern,
+                async_read_view(url.callback),
+                url.default_args,
+                url.name,
+            )
+            if isinstance(url, URLPattern) and url.name in names
+            else url
+        )
+        for url in urls
+    ]
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш в памяти процесса с временем жизни."""
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (
+                value,
+                time.monotonic() + settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+            )
+            self._items.move_to_end(key)
+            while len(self._items) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+local_tokens = LRUCache()
+
+
+def token_cache_key(key):
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def forget_token(key):
+    """Удаляет токен из кэшей, после чего он снова проверяется по БД.
+
+    Из памяти других процессов токен пропадёт не позже чем через
+    AUTH_TOKEN_CACHE_LOCAL_TTL секунд.
+    """
+    local_tokens.delete(key)
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к БД на каждый запрос.
+
+    Пользователь по токену ищется сначала в памяти процесса, затем в
+    общем кэше Django и только потом в БД. В кэшах хранятся только id и
+    is_active пользователя, остальные поля отложены и читаются из БД при
+    первом обращении, поэтому устаревшие данные не попадают в ответы и не
+    записываются при сохранении. Кэши очищаются сигналами при удалении
+    токена и при изменении пользователя.
+    """
+
+    cached_fields = ('id', 'is_active')
+
+    def authenticate_credentials(self, key):
+        values = local_tokens.get(key)
+        if values is None:
+            values = cache.get(token_cache_key(key))
+            if values is None:
+                user, _ = super().authenticate_credentials(key)
+                values = tuple(
+                    getattr(user, field) for field in self.cached_fields
+                )
+                cache.set(
+                    token_cache_key(key),
+                    values,
+                    settings.AUTH_TOKEN_CACHE_TTL,
+                )
+            local_tokens.set(key, values)
+        model = get_user_model()
+        user = model.from_db(
+            router.db_for_read(model),
+            self.cached_fields,
+            values,
+        )
+        return user, Token(key=key, user=user)
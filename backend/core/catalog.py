@@ -0,0 +1,57 @@
+from threading import Lock
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+class CatalogSnapshot:
+    """Сериализованный справочник, актуальный для одной версии."""
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = items
+        self.by_id = {item['id']: item for item in items}
+
+
+class VersionedCatalog:
+    """Кэш справочника в памяти процесса с общей меткой версии.
+
+    Сами данные хранятся в памяти каждого воркера, а метка версии - в
+    кэше Django, общем для всех воркеров. При изменении справочника
+    метка меняется, и каждый воркер перечитывает данные из БД при
+    следующем обращении.
+    """
+
+    snapshot_class = CatalogSnapshot
+
+    def __init__(self, name, serialize, snapshot_class=None):
+        self.key = f'catalog-version:{name}'
+        self.serialize = serialize
+        if snapshot_class is not None:
+            self.snapshot_class = snapshot_class
+        self._snapshot = None
+        self._lock = Lock()
+
+    def get_version(self):
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, uuid4().hex, None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        cache.set(self.key, uuid4().hex, None)
+
+    def load(self):
+        version = self.get_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self.snapshot_class(
+                        version,
+                        list(self.serialize()),
+                    )
+                    self._snapshot = snapshot
+        return snapshot
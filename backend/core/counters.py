@@ -0,0 +1,28 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик объекта на delta одним UPDATE."""
+    change_counters(model, (pk,), field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Атомарно меняет счётчики нескольких объектов одним UPDATE."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)},
+    )
+
+
+def count_related(model, field):
+    """Подзапрос с числом объектов model, ссылающихся на строку по field."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count'),
+        ),
+        0,
+    )
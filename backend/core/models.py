@@ -10,3 +10,41 @@ class NameModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class CountersModel(models.Model):
+    """Модель с денормализованными счётчиками.
+
+    Счётчики из counter_fields меняются только атомарными UPDATE из
+    core.counters. Обычное сохранение уже существующего объекта их не
+    записывает, иначе устаревшие значения в памяти затёрли бы
+    параллельные изменения.
+    """
+
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(
+        self,
+        force_insert=False,
+        force_update=False,
+        using=None,
+        update_fields=None,
+    ):
+        if update_fields is None and not (force_insert or self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        return super().save(
+            force_insert=force_insert,
+            force_update=force_update,
+            using=using,
+            update_fields=update_fields,
+        )
@@ -1,7 +1,94 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт число объектов из кэша по ключу.
+
+    Ключ должен меняться вместе с выборкой, тогда COUNT по всей выборке
+    выполняется один раз на каждое её изменение.
+    """
+
+    def __init__(self, *args, count_cache_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_cache_key = count_cache_key
+
+    @cached_property
+    def count(self):
+        if self.count_cache_key is None:
+            return super().count
+        count = cache.get(self.count_cache_key)
+        if count is None:
+            count = super().count
+            cache.set(
+                self.count_cache_key,
+                count,
+                settings.PAGINATION_COUNT_CACHE_TTL,
+            )
+        return count
 
 
 class LimitPagination(PageNumberPagination):
     page_size = settings.NUM_OBJECTS_ON_PAGE
     page_size_query_param = 'limit'
+    count_cache_key = None
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(
+            object_list,
+            per_page,
+            count_cache_key=self.count_cache_key,
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Представление может задать ключ кэша для числа объектов.
+        self.count_cache_key = getattr(view, 'count_cache_key', None)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class CursorLimitPagination(CursorPagination):
+    page_size = settings.NUM_OBJECTS_ON_PAGE
+    page_size_query_param = 'limit'
+    ordering = ('-created', 'id')
+
+
+class SwitchablePagination(LimitPagination):
+    """Постраничная пагинация с опциональным курсорным режимом.
+
+    По умолчанию работает как LimitPagination. С параметром
+    ?pagination=cursor страницы выбираются по ключу (-created, id) без
+    COUNT и OFFSET, поэтому дальние страницы не дороже первой.
+
+    Курсор сортирует выдачу по своему ключу, поэтому при параметрах из
+    ordered_query_params, задающих собственный порядок (например, ранг
+    поиска), используется обычная постраничная пагинация.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    ordered_query_params = ('search',)
+    cursor_pagination_class = CursorLimitPagination
+    delegate = None
+
+    def is_cursor_mode(self, request):
+        params = request.query_params
+        if params.get(self.mode_query_param) != self.cursor_mode:
+            return False
+        return not any(
+            params.get(param, '').strip()
+            for param in self.ordered_query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.delegate = self.cursor_pagination_class()
+            return self.delegate.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return super().get_paginated_response(data)
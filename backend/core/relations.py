@@ -0,0 +1,215 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal
+
+# Отправляется после массового изменения связей пользователя с объектами:
+# sender - модель связи, user_id - пользователь, target_ids - id объектов,
+# связи с которыми изменились, delta - 1 при добавлении и -1 при удалении.
+relations_changed = Signal()
+
+
+def supports_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def quote_column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def get_columns(model, fields):
+    return (
+        [quote_column(model, name) for name in fields],
+        [value.pk for value in fields.values()],
+    )
+
+
+def insert_relation(model, **fields):
+    """Добавляет связь одним INSERT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Повторное или параллельное добавление не приводит к IntegrityError:
+    такая строка просто не вставляется.
+
+    Returns:
+        Созданный объект или None, если такая связь уже есть.
+    """
+    if not supports_returning():
+        try:
+            with transaction.atomic():
+                return model.objects.create(**fields)
+        except IntegrityError:
+            return None
+    columns, values = get_columns(model, fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} '
+            f'({", ".join(columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(values))}) '
+            'ON CONFLICT DO NOTHING '
+            f'RETURNING {connection.ops.quote_name(model._meta.pk.column)}',
+            values,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance = model(pk=row[0], **fields)
+    post_save.send(
+        sender=model,
+        instance=instance,
+        created=True,
+        update_fields=None,
+        raw=False,
+        using=connection.alias,
+    )
+    return instance
+
+
+def delete_relation(model, **fields):
+    """Удаляет связь одним DELETE ... RETURNING.
+
+    Сигналы удаления отправляются только если строка действительно была
+    удалена этим запросом, поэтому параллельные удаления не изменят
+    зависящие от связи данные дважды.
+
+    Returns:
+        Удалённый объект или None, если такой связи не было.
+    """
+    if not supports_returning():
+        instance = model.objects.filter(**fields).first()
+        if instance is not None:
+            instance.delete()
+        return instance
+    columns, values = get_columns(model, fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+            f'WHERE {" AND ".join(f"{column} = %s" for column in columns)} '
+            f'RETURNING {connection.ops.quote_name(model._meta.pk.column)}',
+            values,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance = model(pk=row[0], **fields)
+    for signal in (pre_delete, post_delete):
+        signal.send(
+            sender=model,
+            instance=instance,
+            using=connection.alias,
+        )
+    return instance
+
+
+def insert_relations(model, user, field, target_ids):
+    """Добавляет связи пользователя с несколькими объектами одним INSERT.
+
+    Args:
+        model: Модель связи с полями user и field.
+        user: Пользователь, для которого добавляются связи.
+        field: Имя поля модели, ссылающегося на объект.
+        target_ids: id объектов, с которыми нужно связать пользователя.
+
+    Returns:
+        Множество id объектов, связи с которыми были добавлены.
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    if supports_returning():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO '
+                f'{connection.ops.quote_name(model._meta.db_table)} '
+                f'({quote_column(model, "user")}, '
+                f'{quote_column(model, field)}) '
+                f'VALUES {", ".join(["(%s, %s)"] * len(target_ids))} '
+                'ON CONFLICT DO NOTHING '
+                f'RETURNING {quote_column(model, field)}',
+                [
+                    value
+                    for target_id in target_ids
+                    for value in (user.pk, target_id)
+                ],
+            )
+            added = {row[0] for row in cursor.fetchall()}
+    else:
+        existing = set(
+            model.objects.filter(
+                user=user,
+                **{f'{field}__in': target_ids},
+            ).values_list(field, flat=True),
+        )
+        added = set(target_ids) - existing
+        model.objects.bulk_create(
+            [
+                model(user=user, **{f'{field}_id': target_id})
+                for target_id in added
+            ],
+            ignore_conflicts=True,
+        )
+    if added:
+        relations_changed.send(
+            sender=model,
+            user_id=user.pk,
+            target_ids=added,
+            delta=1,
+        )
+    return added
+
+
+def delete_relations_sql(model, field, count):
+    return (
+        'DELETE FROM '
+        f'{connection.ops.quote_name(model._meta.db_table)} '
+        f'WHERE {quote_column(model, "user")} = %s '
+        f'AND {quote_column(model, field)} '
+        f'IN ({", ".join(["%s"] * count)})'
+    )
+
+
+def delete_relations(model, user, field, target_ids):
+    """Удаляет связи пользователя с несколькими объектами одним DELETE.
+
+    Returns:
+        Множество id объектов, связи с которыми были удалены.
+    """
+    target_ids = sorted(set(target_ids))
+    if not target_ids:
+        return set()
+    if supports_returning():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                delete_relations_sql(model, field, len(target_ids))
+                + f' RETURNING {quote_column(model, field)}',
+                [user.pk, *target_ids],
+            )
+            deleted = {row[0] for row in cursor.fetchall()}
+    else:
+        # Без RETURNING удаляются ровно те связи, что были прочитаны, тем
+        # же DELETE, что и выше: delete() отправил бы сигналы удаления
+        # для каждой строки, а их заменяет relations_changed.
+        with transaction.atomic():
+            deleted = set(
+                model.objects.filter(
+                    user=user,
+                    **{f'{field}__in': target_ids},
+                ).values_list(field, flat=True),
+            )
+            if deleted:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        delete_relations_sql(model, field, len(deleted)),
+                        [user.pk, *sorted(deleted)],
+                    )
+    if deleted:
+        relations_changed.send(
+            sender=model,
+            user_id=user.pk,
+            target_ids=deleted,
+            delta=-1,
+        )
+    return deleted
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+@receiver(request_started)
+def check_db_connections(sender, **kwargs):
+    """Закрывает постоянные соединения с БД, которые перестали работать.
+
+    При CONN_MAX_AGE > 0 соединение переживает запрос, и к следующему
+    запросу его могли закрыть БД или pgbouncer. Проверяются только
+    соединения, на которых были ошибки или которые простаивали дольше
+    DB_CONN_HEALTH_CHECK_IDLE секунд: соединение, только что
+    отработавшее запрос, почти наверняка живо, и лишний запрос к БД
+    на каждый HTTP-запрос ему не нужен. Неработающее соединение
+    закрывается до начала обработки, и Django откроет новое.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        idle = now - getattr(connection, 'last_request_finished', now)
+        if (
+            connection.errors_occurred
+            or idle >= settings.DB_CONN_HEALTH_CHECK_IDLE
+        ) and not connection.is_usable():
+            connection.close()
+
+
+@receiver(request_finished)
+def mark_db_connections_idle(sender, **kwargs):
+    """Запоминает, с какого момента постоянные соединения простаивают."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_request_finished = now
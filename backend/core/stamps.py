@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+RECIPES_STAMP_KEY = 'stamp:recipes'
+
+
+def user_stamp_key(user_id):
+    return f'stamp:user:{user_id}'
+
+
+def get_stamp(key):
+    """Возвращает время последнего изменения, сохранённое в кэше.
+
+    Если метки ещё нет, она создаётся с текущим временем: клиенты один
+    раз получат полный ответ, зато устаревшие данные не будут отданы.
+    """
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = time.time()
+        cache.add(key, stamp, None)
+    return stamp
+
+
+def touch_stamp(key):
+    cache.set(key, time.time(), None)
+
+
+def touch_stamp_on_commit(key):
+    """Обновляет метку после фиксации текущей транзакции.
+
+    Иначе запрос из другого процесса мог бы между обновлением метки и
+    фиксацией прочитать старые данные и закэшировать их под новой меткой.
+    """
+    transaction.on_commit(lambda: touch_stamp(key))
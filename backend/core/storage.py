@@ -0,0 +1,55 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по хэшу их содержимого.
+
+    Файл сохраняется как <каталог>/<первые два символа хэша>/<хэш>.<расш>,
+    поэтому одинаковые картинки хранятся на диске один раз, а повторная
+    загрузка возвращает имя уже существующего файла. Неиспользуемые
+    файлы удаляет команда gcmedia.
+    """
+
+    hash_chunk_size = 64 * 1024
+
+    def get_content_hash(self, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(self.hash_chunk_size):
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def get_hashed_name(self, name, content):
+        directory, filename = posixpath.split(name.replace(os.sep, '/'))
+        extension = os.path.splitext(filename)[1].lower()
+        content_hash = self.get_content_hash(content)
+        return posixpath.join(
+            directory,
+            content_hash[:2],
+            f'{content_hash}{extension}',
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        try:
+            # Повторно использованный файл получает новое время изменения,
+            # чтобы gcmedia не удалил его до сохранения ссылки на него.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+
+recipe_images_storage = ContentAddressedStorage()
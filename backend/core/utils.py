@@ -1,9 +1,21 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
 from api import serializers
-from recipes.models import IngredientInRecipe, Recipe
+from core.relations import (
+    delete_relation,
+    delete_relations,
+    insert_relation,
+    insert_relations,
+)
+from recipes.models import (
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
 
 
 def checking_availability(user, object, model):
@@ -15,28 +27,63 @@ def checking_availability(user, object, model):
     ).exists()
 
 
+@transaction.atomic
 def add_delete_object(request, pk, model, text):
     user = request.user
-    recipe = get_object_or_404(Recipe, id=pk)
-    filtered_data = model.objects.filter(user=user, recipe=recipe)
     if request.method == 'POST':
-        if filtered_data.exists():
+        recipe = get_object_or_404(Recipe, id=pk)
+        if insert_relation(model, user=user, recipe=recipe) is None:
             return Response(
                 {'error': f'Рецепт уже добавлен в {text}!'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = serializers.RecipeInActionSerializer(
-            recipe,
-            context={'request': request},
-        ).data
-        model.objects.create(user=user, recipe=recipe)
-        return Response(serializer, status=status.HTTP_201_CREATED)
-    if filtered_data.exists():
-        filtered_data.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(
+            serializers.RecipeInActionSerializer(
+                recipe,
+                context={'request': request},
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
+    recipe = get_object_or_404(Recipe.objects.only('id'), id=pk)
+    if delete_relation(model, user=user, recipe=recipe) is None:
+        return Response(
+            {'error': f'Рецепт ещё не добавляли в {text}!'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@transaction.atomic
+def bulk_add_delete_objects(request, model, field, queryset):
+    """Добавляет или удаляет связи пользователя сразу с несколькими объектами.
+
+    Все id проверяются одним запросом, связи меняются одним INSERT или
+    DELETE. Для каждого id возвращается результат: added или exists при
+    добавлении, deleted или missing при удалении и not_found, если
+    объекта нет в queryset.
+    """
+    serializer = serializers.BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    found = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+    if request.method == 'POST':
+        changed = insert_relations(model, request.user, field, found)
+        outcomes = ('added', 'exists')
+    else:
+        changed = delete_relations(model, request.user, field, found)
+        outcomes = ('deleted', 'missing')
     return Response(
-        {'error': f'Рецепт ещё не добавляли в {text}!'},
-        status=status.HTTP_400_BAD_REQUEST,
+        [
+            {
+                'id': id,
+                'status': (
+                    'not_found'
+                    if id not in found
+                    else outcomes[id not in changed]
+                ),
+            }
+            for id in ids
+        ],
     )
 
 
@@ -52,3 +99,59 @@ def add_tags_and_ingredients(tags, ingredients, model):
             for ingredient in ingredients
         ],
     )
+
+
+def update_ingredients(recipe, ingredients):
+    """Приводит ингредиенты рецепта к новому списку.
+
+    Вместо удаления и повторной вставки всех строк создаются только
+    новые ингредиенты, у изменившихся обновляется количество, а
+    исчезнувшие удаляются.
+    """
+    rows = {
+        row.ingredient_id: row for row in recipe.ingredient_in_recipe.all()
+    }
+    old_amounts = {ingredient: row.amount for ingredient, row in rows.items()}
+    new_amounts = {
+        ingredient['id'].id: ingredient['amount'] for ingredient in ingredients
+    }
+    to_create, to_update = [], []
+    for ingredient, amount in new_amounts.items():
+        row = rows.get(ingredient)
+        if row is None:
+            to_create.append(
+                IngredientInRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient,
+                    amount=amount,
+                ),
+            )
+        elif row.amount != amount:
+            row.amount = amount
+            to_update.append(row)
+    to_delete = [
+        row.id
+        for ingredient, row in rows.items()
+        if ingredient not in new_amounts
+    ]
+    if to_delete:
+        IngredientInRecipe.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        IngredientInRecipe.objects.bulk_update(to_update, ('amount',))
+    if to_create:
+        IngredientInRecipe.objects.bulk_create(to_create)
+    update_shopping_cart_totals(recipe, old_amounts, new_amounts)
+
+
+def update_shopping_cart_totals(recipe, old_amounts, new_amounts):
+    ShoppingCartTotal.objects.change(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user',
+            flat=True,
+        ),
+        {
+            ingredient: new_amounts.get(ingredient, 0)
+            - old_amounts.get(ingredient, 0)
+            for ingredient in old_amounts.keys() | new_amounts.keys()
+        },
+    )
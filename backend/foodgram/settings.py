@@ -7,6 +7,35 @@ STR_LENGTH_WHEN_PRINTING_MODEL = 15
 
 NUM_OBJECTS_ON_PAGE = 6
 
+NUM_OBJECTS_IN_AUTOCOMPLETE = 10
+
+NUM_OBJECTS_IN_BULK = 100
+
+NUM_INGREDIENTS_ON_HAND = 500
+
+RECIPE_INGREDIENTS_INDEX_MAX_AGE = 60 * 60
+
+RECIPE_INGREDIENTS_JOURNAL_SIZE = 1000
+
+PAGINATION_COUNT_CACHE_TTL = 60 * 60
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (400, 400),
+    'medium': (1200, 1200),
+}
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+
+AUTH_TOKEN_CACHE_SIZE = 10_000
+
+AUTH_TOKEN_CACHE_LOCAL_TTL = 30
+
+AUTH_TOKEN_CACHE_TTL = 300
+
 NUM_OBJECTS_ON_LAST_PAGE_FOR_TEST = 2
 
 CHECK_ZERO_OBJECTS_FOR_TEST = 0
@@ -77,6 +106,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -85,6 +118,24 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'django_password'),
         'HOST': os.getenv('DB_NAME', 'localhost'),
         'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS') == 'True'
+        ),
+    },
+}
+
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+DB_CONN_HEALTH_CHECK_IDLE = int(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', 10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
     },
 }
 
@@ -136,7 +187,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
     ],
     'SEARCH_PARAM': 'name',
 }
@@ -7,6 +7,7 @@ from recipes.models import (
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingCartTotal,
     Tag,
 )
 
@@ -46,7 +47,7 @@ class RecipeAdmin(BaseAdmin):
     search_fields = ('name',)
 
     def in_favorited(self, object):
-        return Favorite.objects.filter(recipe=object).count()
+        return object.favorites_count
 
     in_favorited.short_description = 'число добавлений в избранное'
 
@@ -74,3 +75,9 @@ class FavoriteAdmin(BaseAdmin):
 class ShoppingCartAdmin(BaseAdmin):
     list_display = ('pk', '__str__')
     search_fields = ('user',)
+
+
+@admin.register(ShoppingCartTotal)
+class ShoppingCartTotalAdmin(BaseAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'total')
+    search_fields = ('user',)
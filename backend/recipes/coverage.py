@@ -0,0 +1,214 @@
+import heapq
+import time
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from recipes.models import (
+    IngredientInRecipe,
+    IngredientsIndexChange,
+    IngredientsIndexVersion,
+)
+
+
+class CoverageResult:
+    """Рецепты, подходящие под набор ингредиентов, от лучших к худшим.
+
+    Ведёт себя как список для пагинатора, но целиком не сортируется:
+    при срезе выбираются только первые stop рецептов. Строки хранятся
+    как (-coverage, missing, -id рецепта, covered), чтобы heapq сравнивал
+    кортежи без функции-ключа.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        top = heapq.nsmallest(index.stop, self.rows)
+        del top[: index.start or 0]
+        return [
+            {
+                'recipe': -recipe,
+                'covered': covered,
+                'missing': missing,
+                'coverage': -coverage,
+            }
+            for coverage, missing, recipe, covered in top
+        ]
+
+
+class RecipeIngredientsIndex:
+    """Обратный индекс «ингредиент -> рецепты» в памяти процесса.
+
+    Индекс строится из таблицы ингредиентов в рецептах при первом
+    обращении, а дальше обновляется по журналу изменений в БД: после
+    сохранения или удаления рецепта его id записывается в журнал под
+    следующим номером версии, и каждый процесс перечитывает из БД только
+    изменившиеся рецепты. Если записей журнала не хватает, их слишком
+    много или индекс старше RECIPE_INGREDIENTS_INDEX_MAX_AGE, индекс
+    строится заново. Перестроение идёт без блокировки, поэтому другие
+    потоки тем временем пользуются прежним индексом.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._rebuilding = False
+        self._version = 0
+        self._built = None
+        self._recipes = {}
+        self._sizes = {}
+        self._postings = defaultdict(set)
+
+    def get_version(self):
+        return (
+            IngredientsIndexVersion.objects.values_list('version', flat=True)
+            .filter(pk=1)
+            .first()
+            or 0
+        )
+
+    def next_version(self):
+        """Увеличивает номер версии; вызывается внутри транзакции."""
+        versions = IngredientsIndexVersion.objects.filter(pk=1)
+        if not versions.update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    IngredientsIndexVersion.objects.create(pk=1, version=1)
+            except IntegrityError:
+                # Строку одновременно создал другой процесс.
+                versions.update(version=F('version') + 1)
+        return self.get_version()
+
+    def changed(self, recipe_ids):
+        """Записывает в журнал id изменившихся рецептов."""
+        with transaction.atomic():
+            version = self.next_version()
+            IngredientsIndexChange.objects.create(
+                version=version,
+                recipe_ids=sorted(recipe_ids),
+            )
+        # Процесс, отставший больше чем на размер журнала, всё равно
+        # перестроит индекс целиком.
+        IngredientsIndexChange.objects.filter(
+            version__lte=version - settings.RECIPE_INGREDIENTS_JOURNAL_SIZE,
+        ).delete()
+
+    def is_fresh(self):
+        return (
+            self._built is not None
+            and time.monotonic() - self._built
+            < settings.RECIPE_INGREDIENTS_INDEX_MAX_AGE
+        )
+
+    def sync(self):
+        version = self.get_version()
+        with self._lock:
+            if self.is_fresh() and self.apply_journal(version):
+                return
+            if self._rebuilding and self._built is not None:
+                # Индекс уже перестраивается другим потоком.
+                return
+            self._rebuilding = True
+        try:
+            self.rebuild(version)
+        finally:
+            self._rebuilding = False
+
+    def apply_journal(self, version):
+        """Применяет журнал до version; False, если записей не хватает."""
+        if version == self._version:
+            return True
+        if not (
+            self._version
+            < version
+            <= self._version + settings.RECIPE_INGREDIENTS_JOURNAL_SIZE
+        ):
+            return False
+        journal = list(
+            IngredientsIndexChange.objects.filter(
+                version__gt=self._version,
+                version__lte=version,
+            ).values_list('recipe_ids', flat=True),
+        )
+        if len(journal) < version - self._version:
+            return False
+        self.update(
+            {recipe for recipe_ids in journal for recipe in recipe_ids},
+        )
+        self._version = version
+        return True
+
+    def rebuild(self, version):
+        """Строит индекс заново из БД и подменяет им текущий.
+
+        version читается до выборки из БД: изменения, сделанные во время
+        перестроения, применятся из журнала ещё раз.
+        """
+        ingredients = defaultdict(set)
+        for recipe, ingredient in IngredientInRecipe.objects.values_list(
+            'recipe',
+            'ingredient',
+        ).iterator():
+            ingredients[recipe].add(ingredient)
+        index = RecipeIngredientsIndex()
+        for recipe, recipe_ingredients in ingredients.items():
+            index.add(recipe, recipe_ingredients)
+        with self._lock:
+            self._recipes = index._recipes
+            self._sizes = index._sizes
+            self._postings = index._postings
+            self._version = version
+            self._built = time.monotonic()
+
+    def update(self, recipe_ids):
+        recipes = defaultdict(set)
+        for recipe, ingredient in IngredientInRecipe.objects.filter(
+            recipe__in=recipe_ids,
+        ).values_list('recipe', 'ingredient'):
+            recipes[recipe].add(ingredient)
+        for recipe in recipe_ids:
+            self._sizes.pop(recipe, None)
+            for ingredient in self._recipes.pop(recipe, ()):
+                self._postings[ingredient].discard(recipe)
+            if recipes[recipe]:
+                self.add(recipe, recipes[recipe])
+
+    def add(self, recipe, ingredients):
+        self._recipes[recipe] = frozenset(ingredients)
+        self._sizes[recipe] = len(ingredients)
+        for ingredient in ingredients:
+            self._postings[ingredient].add(recipe)
+
+    def coverage(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Для каждого рецепта считается, сколько его ингредиентов есть среди
+        ingredient_ids (covered), сколько не хватает (missing) и какая это
+        доля (coverage).
+
+        Args:
+            ingredient_ids: id ингредиентов, которые есть у пользователя.
+            max_missing: Сколько ингредиентов рецепта может не хватать.
+        """
+        self.sync()
+        with self._lock:
+            covered = Counter()
+            for ingredient in set(ingredient_ids):
+                covered.update(self._postings.get(ingredient, ()))
+            sizes = self._sizes
+            rows = [
+                (-count / sizes[recipe], sizes[recipe] - count, -recipe, count)
+                for recipe, count in covered.items()
+            ]
+        if max_missing is not None:
+            rows = [row for row in rows if row[1] <= max_missing]
+        return CoverageResult(rows)
+
+
+recipe_ingredients_index = RecipeIngredientsIndex()
@@ -0,0 +1,108 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps, features
+
+from core.stamps import RECIPES_STAMP_KEY, touch_stamp
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/images/renditions'
+
+# Форматы уменьшенных копий: расширение, формат Pillow и параметры
+# сохранения. WebP создаётся, только если Pillow собран с libwebp.
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_formats():
+    return [
+        (extension, format, options)
+        for extension, format, options in FORMATS
+        if format != 'WEBP' or features.check('webp')
+    ]
+
+
+def rendition_name(name, rendition, extension):
+    return (
+        f'{RENDITIONS_DIR}/{PurePosixPath(name).stem}-{rendition}.{extension}'
+    )
+
+
+def make_renditions(recipe_id, name, force=False):
+    """Создаёт уменьшенные копии картинки рецепта.
+
+    Копии сохраняются в хранилище, а их имена записываются в
+    Recipe.image_renditions, если картинка рецепта за это время не
+    сменилась. Имена картинок зависят от содержимого, поэтому уже
+    созданные копии той же картинки используются повторно. С force=True
+    файлы копий создаются заново, даже если они уже есть.
+    """
+    with Recipe._meta.get_field('image').storage.open(name) as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    renditions = {'source': name}
+    for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail(size)
+        renditions[rendition] = {}
+        for extension, format, options in get_formats():
+            if format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            target = rendition_name(name, rendition, extension)
+            exists = default_storage.exists(target)
+            if force or not exists:
+                buffer = BytesIO()
+                image.save(buffer, format, **options)
+                if exists:
+                    default_storage.delete(target)
+                target = default_storage.save(
+                    target,
+                    ContentFile(buffer.getvalue()),
+                )
+            renditions[rendition][extension] = target
+    if Recipe.objects.filter(id=recipe_id, image=name).update(
+        image_renditions=renditions,
+    ):
+        touch_stamp(RECIPES_STAMP_KEY)
+    return renditions
+
+
+def run_in_worker(recipe_id, name):
+    try:
+        make_renditions(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось создать копии картинки %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id, name):
+    """Ставит создание копий картинки в пул фоновых потоков.
+
+    Если RECIPE_IMAGE_WORKERS равно нулю, копии создаются сразу.
+    """
+    global _executor
+    if not settings.RECIPE_IMAGE_WORKERS:
+        make_renditions(recipe_id, name)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    _executor.submit(run_in_worker, recipe_id, name)
@@ -0,0 +1,64 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить число запросов в секунду к списку рецептов с новым '
+        'соединением с БД на каждый запрос и с постоянным соединением'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/recipes/')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--conn-max-age', type=int, default=60)
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        initial = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for title, conn_max_age in (
+                    ('Без постоянных соединений', 0),
+                    (
+                        f'CONN_MAX_AGE={options["conn_max_age"]}',
+                        options['conn_max_age'],
+                    ),
+                ):
+                    self.report(
+                        title,
+                        self.measure(client, conn_max_age, options),
+                        options['requests'],
+                    )
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = initial
+
+    @staticmethod
+    def measure(client, conn_max_age, options):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        client.get(options['url'])
+        connects = 0
+        started = perf_counter()
+        for _ in range(options['requests']):
+            # Тестовый клиент не закрывает соединения после ответа, поэтому
+            # обработку request_started/request_finished WSGI-сервера
+            # повторяем здесь.
+            close_old_connections()
+            connects += connection.connection is None
+            client.get(options['url'])
+            close_old_connections()
+        return perf_counter() - started, connects
+
+    def report(self, title, result, requests):
+        elapsed, connects = result
+        self.stdout.write(
+            f'{title}: {requests / elapsed:.0f} запросов/с, '
+            f'{elapsed / requests * 1000:.2f} мс на запрос, '
+            f'новых соединений: {connects}',
+        )
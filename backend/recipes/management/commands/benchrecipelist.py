@@ -0,0 +1,132 @@
+from functools import reduce
+from operator import or_
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+BENCH_PREFIX = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить время ответа списка рецептов с фильтром по тегам. '
+        'Данные создаются в транзакции и откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--tags', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            slugs = self.seed(options)
+            tags_filter = reduce(or_, [Q(tags__slug=slug) for slug in slugs])
+            self.report(
+                'Старый фильтр (OR + DISTINCT), COUNT и первая страница',
+                self.measure(
+                    lambda: self.fetch_page(
+                        Recipe.objects.filter(tags_filter).distinct(),
+                    ),
+                    options['repeat'],
+                ),
+            )
+            self.report(
+                'Новый фильтр (id IN подзапрос), COUNT и первая страница',
+                self.measure(
+                    lambda: self.fetch_page(
+                        Recipe.objects.filter(
+                            id__in=Recipe.tags.through.objects.filter(
+                                tag__slug__in=slugs,
+                            ).values('recipe'),
+                        ),
+                    ),
+                    options['repeat'],
+                ),
+            )
+            client = APIClient()
+            url = '/api/recipes/?' + '&'.join(f'tags={slug}' for slug in slugs)
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url)
+                self.report(
+                    f'GET {url} ({len(queries)} запросов к БД)',
+                    self.measure(lambda: client.get(url), options['repeat']),
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        author = User.objects.create(
+            email=f'{BENCH_PREFIX}@example.com',
+            username=BENCH_PREFIX,
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'{BENCH_PREFIX}-{number}',
+                color=f'#BE{number:04X}',
+                slug=f'{BENCH_PREFIX}-{number}',
+            )
+            for number in range(options['tags'] * 2)
+        ]
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    name=f'{BENCH_PREFIX}-{number}',
+                    author=author,
+                    image='recipes/images/bench.png',
+                    text=BENCH_PREFIX,
+                    cooking_time=1,
+                )
+                for number in range(options['recipes'])
+            ),
+            batch_size=options['batch_size'],
+        )
+        TagInRecipe = Recipe.tags.through
+        TagInRecipe.objects.bulk_create(
+            (
+                TagInRecipe(
+                    recipe_id=recipe,
+                    tag_id=tags[index % len(tags)].id,
+                )
+                for index, recipe in enumerate(
+                    Recipe.objects.filter(author=author)
+                    .values_list('id', flat=True)
+                    .iterator(),
+                )
+            ),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            f'Создано рецептов: {options["recipes"]}, тегов: {len(tags)}',
+        )
+        return [tag.slug for tag in tags[: options['tags']]]
+
+    @staticmethod
+    def fetch_page(queryset):
+        queryset.count()
+        list(queryset.order_by('-created')[:6])
+
+    @staticmethod
+    def measure(run, repeat):
+        run()
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            run()
+            timings.append((perf_counter() - started) * 1000)
+        return sorted(timings)
+
+    def report(self, title, timings):
+        self.stdout.write(
+            f'{title}: медиана {median(timings):.1f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} мс',
+        )
@@ -0,0 +1,71 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Удалить файлы картинок рецептов и их копий, на которые не '
+        'ссылается ни один рецепт'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help=(
+                'Не удалять файлы моложе заданного числа минут: они могут '
+                'принадлежать ещё не сохранённым рецептам'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        references = Counter()
+        for recipe in Recipe.objects.exclude(image='').only(
+            'image',
+            'image_renditions',
+        ):
+            references[recipe.image.name] += 1
+            for files in recipe.get_image_renditions().values():
+                references.update(files.values())
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        files = deleted = freed = 0
+        for name in self.walk(field.storage, field.upload_to.rstrip('/')):
+            files += 1
+            if references[name]:
+                continue
+            if field.storage.get_modified_time(name) > threshold:
+                continue
+            size = field.storage.size(name)
+            self.stdout.write(f'{name} ({size} байт)')
+            if not options['dry_run']:
+                field.storage.delete(name)
+            deleted += 1
+            freed += size
+        self.stdout.write(
+            f'Файлов: {files}, используются: {len(references)} '
+            f'(ссылок из рецептов: {sum(references.values())}), '
+            f'{"к удалению" if options["dry_run"] else "удалено"}: '
+            f'{deleted}, {freed} байт',
+        )
+
+    def walk(self, storage, path):
+        if not storage.exists(path):
+            return
+        directories, files = storage.listdir(path)
+        for file in files:
+            yield posixpath.join(path, file)
+        for directory in directories:
+            yield from self.walk(storage, posixpath.join(path, directory))
@@ -1,32 +1,137 @@
 import csv
+import json
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.catalogs import ingredients_catalog, tags_catalog
+from core.stamps import RECIPES_STAMP_KEY, touch_stamp
 from recipes.models import Ingredient, Tag
 
+DATA_PATH = settings.BASE_DIR / 'static' / 'data'
+
+# Для каждой модели: опция с путём к файлу, поля в порядке столбцов csv,
+# поле, по которому строка считается уже загруженной, справочник API
+# и приведение значений полей. bulk_create не вызывает save(), поэтому
+# то, что модель делает в save(), повторяется здесь.
+MODELS = (
+    (
+        'tags',
+        Tag,
+        ('name', 'color', 'slug'),
+        'slug',
+        tags_catalog,
+        {'color': str.upper},
+    ),
+    (
+        'ingredients',
+        Ingredient,
+        ('name', 'measurement_unit'),
+        'name',
+        ingredients_catalog,
+        {},
+    ),
+)
+
 
 class Command(BaseCommand):
-    help = 'Выполнить импорт данных из csv файлов'
+    help = (
+        'Выполнить импорт тегов и ингредиентов из csv или json файлов. '
+        'Уже загруженные записи пропускаются, поэтому команду можно '
+        'запускать повторно'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tags',
+            type=Path,
+            default=DATA_PATH / 'tags.csv',
+            help='Файл с тегами (.csv или .json)',
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=Path,
+            default=DATA_PATH / 'ingredients.csv',
+            help='Файл с ингредиентами (.csv или .json)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число записей в одном INSERT',
+        )
 
     def handle(self, *args, **options):
-        file_path = settings.BASE_DIR / 'static' / 'data'
-        with open(file_path / 'tags.csv', encoding='utf-8') as csv_file:
-            reader_object = csv.reader(csv_file)
-            for row in reader_object:
-                if not Tag.objects.filter(slug=row[2]).exists():
-                    Tag.objects.create(
-                        name=row[0],
-                        color=row[1],
-                        slug=row[2],
-                    )
-            print('Данные тегов загружены в БД!')
-        with open(file_path / 'ingredients.csv', encoding='utf-8') as csv_file:
-            reader_object = csv.reader(csv_file)
-            for row in reader_object:
-                if not Ingredient.objects.filter(name=row[0]).exists():
-                    Ingredient.objects.create(
-                        name=row[0],
-                        measurement_unit=row[1],
-                    )
-            print('Данные ингредиентов загружены в БД!')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        started = perf_counter()
+        total = 0
+        with transaction.atomic():
+            for option, model, fields, key, catalog, normalize in MODELS:
+                path = options[option]
+                created = self.load(
+                    model,
+                    key,
+                    self.normalize(self.read(path, fields), normalize),
+                    options['batch_size'],
+                )
+                if created:
+                    # bulk_create не отправляет сигналы, поэтому версия
+                    # справочника меняется здесь.
+                    transaction.on_commit(catalog.bump)
+                total += created
+                self.stdout.write(
+                    f'Данные из {path.name} загружены в БД! '
+                    f'Добавлено записей: {created}',
+                )
+        if total:
+            touch_stamp(RECIPES_STAMP_KEY)
+        self.stdout.write(f'Импорт занял {perf_counter() - started:.2f} с')
+
+    def read(self, path, fields):
+        """Построчно читает записи из csv или json файла."""
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        with open(path, encoding='utf-8') as file:
+            if path.suffix == '.json':
+                for row in json.load(file):
+                    yield {field: row[field] for field in fields}
+                return
+            for row in csv.reader(file):
+                yield dict(zip(fields, row))
+
+    def normalize(self, rows, normalize):
+        """Приводит значения полей так же, как это делает save() модели."""
+        for row in rows:
+            for field, function in normalize.items():
+                row[field] = function(row[field])
+            yield row
+
+    def load(self, model, key, rows, batch_size):
+        """Добавляет записи, которых ещё нет в БД, пачками bulk_create.
+
+        Возвращает число реально добавленных записей: строки, которые
+        bulk_create пропустил из-за конфликта уникальности, не считаются.
+        """
+        existing = set(model.objects.values_list(key, flat=True))
+        before = len(existing)
+        processed = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return model.objects.count() - before
+            objects = []
+            for row in batch:
+                if row[key] in existing:
+                    continue
+                existing.add(row[key])
+                objects.append(model(**row))
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+            processed += len(batch)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано {processed}',
+            )
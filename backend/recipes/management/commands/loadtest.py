@@ -0,0 +1,126 @@
+import asyncio
+from statistics import median
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: много параллельных клиентов '
+        'с keep-alive соединениями, пропускная способность и задержки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='+',
+            help='Адреса, например http://127.0.0.1:9000/api/recipes/',
+        )
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        for url in options['urls']:
+            parts = urlsplit(url)
+            if parts.scheme != 'http' or not parts.hostname:
+                raise CommandError(f'Поддерживаются только http адреса: {url}')
+            elapsed, timings, errors = asyncio.run(
+                self.run(parts, options),
+            )
+            timings.sort()
+            self.stdout.write(
+                (
+                    f'{url}: {len(timings) / elapsed:.0f} запросов/с, '
+                    f'медиана {median(timings):.1f} мс, '
+                    f'p99 {timings[int(len(timings) * 0.99) - 1]:.1f} мс, '
+                    f'ошибок: {errors}'
+                    if timings
+                    else f'{url}: нет успешных ответов, ошибок: {errors}'
+                ),
+            )
+
+    async def run(self, parts, options):
+        path = parts.path or '/'
+        if parts.query:
+            path += f'?{parts.query}'
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            'Connection: keep-alive\r\n\r\n'
+        ).encode()
+        # Клиенты берут номера запросов из общего итератора, пока он не
+        # закончится, поэтому всего отправляется ровно --requests запросов.
+        remaining = iter(range(options['requests']))
+        timings = []
+        errors = []
+        started = perf_counter()
+        await asyncio.gather(
+            *(
+                self.client(
+                    parts,
+                    request,
+                    remaining,
+                    timings,
+                    errors,
+                    options['timeout'],
+                )
+                for _ in range(options['concurrency'])
+            ),
+        )
+        return perf_counter() - started, timings, len(errors)
+
+    async def client(
+        self, parts, request, remaining, timings, errors, timeout
+    ):
+        """Отправляет запросы по одному keep-alive соединению."""
+        reader = writer = None
+        for number in remaining:
+            started = perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        parts.hostname,
+                        parts.port or 80,
+                    )
+                writer.write(request)
+                status, keep_alive = await asyncio.wait_for(
+                    self.read_response(reader),
+                    timeout,
+                )
+            except (OSError, asyncio.TimeoutError, ValueError):
+                status, keep_alive = None, False
+            if status == 200:
+                timings.append((perf_counter() - started) * 1000)
+            else:
+                errors.append(number)
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    @staticmethod
+    async def read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ValueError('Соединение закрыто сервером')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers.get('connection') != 'close'
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создать уменьшенные копии картинок рецептов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии картинок всех рецептов',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help=(
+                'Перезаписать уже существующие файлы копий, например '
+                'повреждённые или созданные с другими настройками'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        created = failed = 0
+        for recipe in Recipe.objects.exclude(image='').only(
+            'id',
+            'image',
+            'image_renditions',
+        ):
+            if recipe.get_image_renditions() and not (
+                options['all'] or options['force']
+            ):
+                continue
+            try:
+                make_renditions(
+                    recipe.id,
+                    recipe.image.name,
+                    force=options['force'],
+                )
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            created += 1
+        self.stdout.write(
+            f'Копии картинок созданы для рецептов: {created}, '
+            f'ошибок: {failed}',
+        )
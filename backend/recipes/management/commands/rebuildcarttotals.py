@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать итоги списков покупок и сверить их с агрегатом'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу итогов, не пересчитывая её',
+        )
+
+    def handle(self, *args, **options):
+        live = {
+            (row['user'], row['ingredient']): row['total']
+            for row in ShoppingCartTotal.objects.live()
+        }
+        stored = {
+            (row['user'], row['ingredient']): row['total']
+            for row in ShoppingCartTotal.objects.values(
+                'user',
+                'ingredient',
+                'total',
+            )
+        }
+        mismatches = [
+            key
+            for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        ]
+        for user, ingredient in sorted(mismatches):
+            self.stdout.write(
+                f'Пользователь {user}, ингредиент {ingredient}: '
+                f'в таблице {stored.get((user, ingredient))}, '
+                f'по агрегату {live.get((user, ingredient))}',
+            )
+        if options['check']:
+            if mismatches:
+                raise CommandError(
+                    f'Расхождений в итогах списков покупок: '
+                    f'{len(mismatches)}',
+                )
+            self.stdout.write('Итоги списков покупок совпадают с агрегатом!')
+            return
+        ShoppingCartTotal.objects.rebuild()
+        self.stdout.write(
+            f'Итоги списков покупок пересчитаны, исправлено расхождений: '
+            f'{len(mismatches)}',
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from core.counters import count_related
+from recipes.models import Favorite, Recipe
+from users.models import Subscribe, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'following'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать денормализованные счётчики рецептов и пользователей'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                drifted = (
+                    model.objects.annotate(
+                        actual=count_related(related_model, related_field),
+                    )
+                    .exclude(**{field: F('actual')})
+                    .values_list('pk', flat=True)
+                )
+                fixed = model.objects.filter(pk__in=list(drifted)).update(
+                    **{field: count_related(related_model, related_field)},
+                )
+                self.stdout.write(
+                    f'{model.__name__}.{field}: исправлено {fixed}',
+                )
@@ -0,0 +1,85 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_shopping_cart_totals(apps, schema_editor):
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=row['recipe__shoppingcart__user'],
+            ingredient_id=row['ingredient'],
+            total=row['total'],
+        )
+        for row in IngredientInRecipe.objects.filter(
+            recipe__shoppingcart__isnull=False,
+        )
+        .values('recipe__shoppingcart__user', 'ingredient')
+        .annotate(total=models.Sum('amount'))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_Added_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'total',
+                    models.PositiveIntegerField(
+                        help_text='Введите итоговое количество ингредиента',
+                        verbose_name='итоговое количество',
+                    ),
+                ),
+                (
+                    'ingredient',
+                    models.ForeignKey(
+                        help_text='Выберите ингредиент',
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='recipes.ingredient',
+                        verbose_name='ингредиент',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        help_text='Выберите пользователя',
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name='пользователь',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'итог списка покупок',
+                'verbose_name_plural': 'итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_cart_total',
+            ),
+        ),
+        migrations.RunPython(
+            fill_shopping_cart_totals,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipes_ingredient_name_like'
+
+
+def create_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        '(UPPER(name::text) text_pattern_ops)'
+    )
+
+
+def drop_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0005_Added_ShoppingCartTotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_name_pattern_index,
+            drop_name_pattern_index,
+        ),
+    ]
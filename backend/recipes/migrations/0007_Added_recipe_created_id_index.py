@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0006_Added_ingredient_name_pattern_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-created', 'id'], name='recipe_created_id_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_favorites_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe.objects.update(
+        favorites_count=Coalesce(
+            Subquery(
+                Favorite.objects.filter(recipe=OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(count=Count('pk'))
+                .values('count'),
+            ),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0007_Added_recipe_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='Число добавлений рецепта в избранное',
+                verbose_name='число добавлений в избранное',
+            ),
+        ),
+        migrations.RunPython(
+            fill_favorites_count,
+            migrations.RunPython.noop,
+        ),
+    ]
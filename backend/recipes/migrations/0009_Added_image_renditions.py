@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0008_Added_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                help_text='Имена файлов уменьшенных копий картинки',
+                verbose_name='уменьшенные копии картинки',
+            ),
+        ),
+    ]
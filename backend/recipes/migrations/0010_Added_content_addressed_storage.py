@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+import core.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0009_Added_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(
+                help_text='Выберите картинку',
+                storage=core.storage.ContentAddressedStorage(),
+                upload_to='recipes/images/',
+                verbose_name='картинка',
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def create_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE recipes_recipe SET search_vector = "
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(("
+        "SELECT string_agg(ingredient.name, ' ') "
+        "FROM recipes_ingredientinrecipe AS item "
+        "JOIN recipes_ingredient AS ingredient "
+        "ON ingredient.id = item.ingredient_id "
+        "WHERE item.recipe_id = recipes_recipe.id"
+        "), '')), 'B') || "
+        "setweight(to_tsvector('russian', coalesce(text, '')), 'C')"
+    )
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_recipe '
+        'USING gin (search_vector)'
+    )
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0010_Added_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True,
+                editable=False,
+                help_text='Основы слов названия, ингредиентов и описания',
+                null=True,
+                verbose_name='поисковый вектор',
+            ),
+        ),
+        migrations.RunPython(
+            create_search_vector_index,
+            drop_search_vector_index,
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0012_Added_recipe_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientsIndexChange',
+            fields=[
+                (
+                    'version',
+                    models.PositiveBigIntegerField(
+                        help_text='Номер записи журнала',
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='номер версии',
+                    ),
+                ),
+                (
+                    'recipe_ids',
+                    models.JSONField(
+                        help_text='Рецепты, у которых изменились ингредиенты',
+                        verbose_name='id рецептов',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'изменение индекса ингредиентов',
+                'verbose_name_plural': 'изменения индекса ингредиентов',
+            },
+        ),
+        migrations.CreateModel(
+            name='IngredientsIndexVersion',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'version',
+                    models.PositiveBigIntegerField(
+                        default=0,
+                        help_text='Номер последней записи журнала',
+                        verbose_name='номер версии',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'версия индекса ингредиентов',
+                'verbose_name_plural': 'версии индекса ингредиентов',
+            },
+        ),
+    ]
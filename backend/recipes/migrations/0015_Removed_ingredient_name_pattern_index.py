@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Индекс из 0006 обслуживал поиск ингредиентов по началу названия в БД.
+# Теперь ?name= и автодополнение обслуживает IngredientIndex в памяти
+# процесса, а админка ищет по подстроке, поэтому индекс не читает ни один
+# запрос.
+INDEX_NAME = 'recipes_ingredient_name_like'
+
+
+def drop_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+def create_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        '(UPPER(name::text) text_pattern_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('recipes', '0014_Removed_recipe_modified_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_name_pattern_index,
+            create_name_pattern_index,
+        ),
+    ]
@@ -1,10 +1,13 @@
 from behaviors.behaviors import Timestamped
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
 
-from core.models import NameModel
+from core.models import CountersModel, NameModel
+from core.storage import recipe_images_storage
 from recipes.utils import cut_string
-from users.models import User
+from users.models import Subscribe, User
 
 
 class Tag(NameModel):
@@ -43,7 +46,98 @@ class Ingredient(NameModel):
         return cut_string(self.name)
 
 
-class Recipe(NameModel, Timestamped):
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False,
+                    output_field=models.BooleanField(),
+                ),
+                is_in_shopping_cart=models.Value(
+                    False,
+                    output_field=models.BooleanField(),
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk'),
+                ),
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=models.OuterRef('pk'),
+                ),
+            ),
+        )
+
+    def filter_by_relation(self, model, user, exists):
+        """Оставляет рецепты, которые есть (или нет) у пользователя в model.
+
+        Рецепты пользователя выбираются как id IN (...) по индексу
+        (user, recipe), поэтому их число считается без обхода всех
+        рецептов. Остальные отбираются через NOT EXISTS по тому же индексу.
+        Для анонимного пользователя связей нет, поэтому запрос не нужен.
+        """
+        if user.is_anonymous:
+            return self.none() if exists else self
+        if exists:
+            return self.filter(
+                id__in=model.objects.filter(user=user).values('recipe'),
+            )
+        return self.exclude(
+            models.Exists(
+                model.objects.filter(user=user, recipe=models.OuterRef('pk')),
+            ),
+        )
+
+    def latest_per_author(self, limit):
+        """Оставляет не больше limit последних рецептов каждого автора."""
+        return self.filter(
+            id__in=models.Subquery(
+                Recipe.objects.filter(author=models.OuterRef('author'))
+                .order_by('-created', 'id')
+                .values('id')[:limit],
+            ),
+        )
+
+    def for_listing(self, user):
+        if user.is_anonymous:
+            authors = User.objects.annotate(
+                is_subscribed=models.Value(
+                    False,
+                    output_field=models.BooleanField(),
+                ),
+            )
+        else:
+            authors = User.objects.annotate(
+                is_subscribed=models.Exists(
+                    Subscribe.objects.filter(
+                        user=user,
+                        following=models.OuterRef('pk'),
+                    ),
+                ),
+            )
+        return (
+            self.with_user_flags(user)
+            .defer('search_vector')
+            .prefetch_related(
+                models.Prefetch('author', queryset=authors),
+                'tags',
+                models.Prefetch(
+                    'ingredient_in_recipe',
+                    queryset=IngredientInRecipe.objects.select_related(
+                        'ingredient',
+                    ),
+                ),
+            )
+        )
+
+
+class Recipe(CountersModel, NameModel, Timestamped):
     tags = models.ManyToManyField(
         Tag,
         verbose_name='список тегов',
@@ -52,14 +146,23 @@ class Recipe(NameModel, Timestamped):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        # Поиск по автору идёт по индексу recipe_author_created_idx.
+        db_index=False,
         verbose_name='автор',
         help_text='Выберите автора',
     )
     image = models.ImageField(
         'картинка',
         upload_to='recipes/images/',
+        storage=recipe_images_storage,
         help_text='Выберите картинку',
     )
+    image_renditions = models.JSONField(
+        'уменьшенные копии картинки',
+        default=dict,
+        editable=False,
+        help_text='Имена файлов уменьшенных копий картинки',
+    )
     text = models.TextField(
         'описание',
         help_text='Введите описание рецепта',
@@ -75,11 +178,38 @@ class Recipe(NameModel, Timestamped):
         validators=[MinValueValidator(1)],
         help_text='Введите время приготовления (в минутах)',
     )
+    favorites_count = models.PositiveIntegerField(
+        'число добавлений в избранное',
+        default=0,
+        editable=False,
+        help_text='Число добавлений рецепта в избранное',
+    )
+    search_vector = SearchVectorField(
+        'поисковый вектор',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='Основы слов названия, ингредиентов и описания',
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count',)
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['-created', 'id'],
+                name='recipe_created_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-created', 'id'],
+                name='recipe_author_created_idx',
+            ),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -89,6 +219,21 @@ class Recipe(NameModel, Timestamped):
     def __str__(self) -> str:
         return cut_string(self.name)
 
+    def get_image_renditions(self):
+        """Имена файлов уменьшенных копий актуальной картинки."""
+        if self.image_renditions.get('source') != self.image.name:
+            return {}
+        return {
+            rendition: files
+            for rendition, files in self.image_renditions.items()
+            if rendition != 'source'
+        }
+
+    def ingredient_amounts(self):
+        return dict(
+            self.ingredient_in_recipe.values_list('ingredient', 'amount'),
+        )
+
 
 class IngredientInRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -180,3 +325,161 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return f'`{self.user}` добавил в список покупок `{self.recipe}`'
+
+
+class ShoppingCartTotalQuerySet(models.QuerySet):
+    def live(self):
+        """Агрегат списков покупок, посчитанный по рецептам в корзинах."""
+        return (
+            IngredientInRecipe.objects.filter(
+                recipe__shoppingcart__isnull=False,
+            )
+            .values(
+                'ingredient',
+                user=models.F('recipe__shoppingcart__user'),
+            )
+            .annotate(total=models.Sum('amount'))
+            .order_by()
+        )
+
+    def change(self, user_ids, deltas):
+        """Изменяет итоги пользователей на заданные количества.
+
+        Args:
+            user_ids: id пользователей, чьи списки покупок меняются.
+            deltas: Словарь вида {id ингредиента: изменение количества}.
+        """
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        totals = self.filter(user__in=user_ids, ingredient__in=deltas)
+        with transaction.atomic():
+            # Недостающие строки создаются с нулём: параллельная вставка
+            # той же пары не падает на уникальном ограничении, а ждёт.
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total=0,
+                    )
+                    for user_id in sorted(user_ids)
+                    for ingredient_id in sorted(deltas)
+                    if deltas[ingredient_id] > 0
+                ),
+                ignore_conflicts=True,
+            )
+            # Строки блокируются в одном порядке, чтобы пересекающиеся
+            # изменения не ждали друг друга по кругу.
+            list(
+                totals.select_for_update()
+                .order_by('user_id', 'ingredient_id')
+                .values_list('id', flat=True),
+            )
+            totals.update(
+                total=Greatest(
+                    models.F('total')
+                    + models.Case(
+                        *(
+                            models.When(ingredient=ingredient, then=delta)
+                            for ingredient, delta in deltas.items()
+                        ),
+                        output_field=models.IntegerField(),
+                    ),
+                    0,
+                ),
+            )
+            totals.filter(total__lte=0).delete()
+
+    def rebuild(self):
+        """Пересчитывает таблицу итогов с нуля по живому агрегату."""
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                self.model(
+                    user_id=row['user'],
+                    ingredient_id=row['ingredient'],
+                    total=row['total'],
+                )
+                for row in self.live()
+            )
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='пользователь',
+        help_text='Выберите пользователя',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='ингредиент',
+        help_text='Выберите ингредиент',
+    )
+    total = models.PositiveIntegerField(
+        'итоговое количество',
+        help_text='Введите итоговое количество ингредиента',
+    )
+
+    objects = ShoppingCartTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'итог списка покупок'
+        verbose_name_plural = 'итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_total',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'`{self.user}` должен купить `{self.ingredient}`'
+
+
+class IngredientsIndexVersion(models.Model):
+    """Номер последней записи журнала индекса ингредиентов.
+
+    В таблице одна строка. Её UPDATE блокирует строку до конца
+    транзакции, поэтому номера записей журнала идут подряд и
+    фиксируются по порядку.
+    """
+
+    version = models.PositiveBigIntegerField(
+        'номер версии',
+        default=0,
+        help_text='Номер последней записи журнала',
+    )
+
+    class Meta:
+        verbose_name = 'версия индекса ингредиентов'
+        verbose_name_plural = 'версии индекса ингредиентов'
+
+    def __str__(self) -> str:
+        return f'Версия индекса ингредиентов {self.version}'
+
+
+class IngredientsIndexChange(models.Model):
+    version = models.PositiveBigIntegerField(
+        'номер версии',
+        primary_key=True,
+        help_text='Номер записи журнала',
+    )
+    recipe_ids = models.JSONField(
+        'id рецептов',
+        help_text='Рецепты, у которых изменились ингредиенты',
+    )
+
+    class Meta:
+        verbose_name = 'изменение индекса ингредиентов'
+        verbose_name_plural = 'изменения индекса ингредиентов'
+
+    def __str__(self) -> str:
+        return f'Изменение индекса ингредиентов {self.version}'
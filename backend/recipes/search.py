@@ -0,0 +1,231 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+
+from core.catalog import CatalogSnapshot, VersionedCatalog
+from recipes.models import IngredientInRecipe, Recipe
+from recipes.stemmer import stem
+
+SEARCH_CONFIG = 'russian'
+
+# Веса полей рецепта в поисковом векторе и их множители при ранжировании
+# (те же, что по умолчанию у ts_rank в PostgreSQL).
+SEARCH_WEIGHTS = (
+    ('name', 'A', 1.0),
+    ('ingredients', 'B', 0.4),
+    ('text', 'C', 0.2),
+)
+
+# Самые частые слова из списка стоп-слов словаря russian в PostgreSQL.
+STOP_WORDS = frozenset(
+    'а без более бы был была были было быть в вам вас весь во вот все всего '
+    'всех вы где да даже для до его ее если есть еще же за здесь и из или '
+    'им их к как ко когда кто ли либо мне может мы на надо наш не него нее '
+    'нет ни них но ну о об однако он она они оно от очень по под при с со '
+    'так также такой там те тем то того тоже той только том ты у уже хотя '
+    'чего чей чем что чтобы чье чья эта эти это я'.split(),
+)
+
+
+class IngredientIndex:
+    """Индекс ингредиентов для поиска по названию.
+
+    Названия хранятся в отсортированном массиве, поэтому совпадения
+    по началу строки ищутся бинарным поиском. Для автодополнения
+    результат дополняется совпадениями по подстроке.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients,
+            key=lambda ingredient: (
+                ingredient['name'].lower(),
+                ingredient['id'],
+            ),
+        )
+        self.keys = [
+            ingredient['name'].lower() for ingredient in self.ingredients
+        ]
+
+    def prefix(self, query, limit=None):
+        query = query.strip().lower()
+        found = []
+        for position in range(bisect_left(self.keys, query), len(self.keys)):
+            if not self.keys[position].startswith(query):
+                break
+            if len(found) == limit:
+                break
+            found.append(self.ingredients[position])
+        return found
+
+    def search(self, query, limit):
+        query = query.strip().lower()
+        if not query or limit < 1:
+            return []
+        found = self.prefix(query, limit)
+        if len(found) == limit:
+            return found
+        for position, key in enumerate(self.keys):
+            if query in key and not key.startswith(query):
+                found.append(self.ingredients[position])
+                if len(found) == limit:
+                    break
+        return found
+
+
+def get_lexemes(text):
+    """Основы слов текста без стоп-слов, как у to_tsvector('russian')."""
+    return [
+        stem(word)
+        for word in re.findall(r'\w+', text.lower().replace('ё', 'е'))
+        if word not in STOP_WORDS
+    ]
+
+
+class RecipeSearchIndex:
+    """Обратный индекс рецептов для поиска без PostgreSQL.
+
+    Для каждой основы слова хранятся id рецептов и вес совпадения, поэтому
+    поиск перебирает только рецепты, содержащие слова запроса.
+    """
+
+    def __init__(self, recipes):
+        self.postings = defaultdict(dict)
+        for recipe in recipes:
+            for field, _, weight in SEARCH_WEIGHTS:
+                for lexeme in get_lexemes(recipe[field]):
+                    postings = self.postings[lexeme]
+                    postings[recipe['id']] = (
+                        postings.get(recipe['id'], 0) + weight
+                    )
+
+    def search(self, query):
+        """Ранги рецептов, содержащих все слова запроса.
+
+        Returns:
+            Словарь вида {id рецепта: ранг}.
+        """
+        postings = sorted(
+            (
+                self.postings.get(lexeme, {})
+                for lexeme in set(get_lexemes(query))
+            ),
+            key=len,
+        )
+        if not postings:
+            return {}
+        ranks = dict(postings[0])
+        for lexeme_postings in postings[1:]:
+            ranks = {
+                recipe: rank + lexeme_postings[recipe]
+                for recipe, rank in ranks.items()
+                if recipe in lexeme_postings
+            }
+        return ranks
+
+
+class RecipeSearchSnapshot(CatalogSnapshot):
+    def __init__(self, version, items):
+        super().__init__(version, items)
+        self.index = RecipeSearchIndex(items)
+
+
+def serialize_recipes_for_search():
+    ingredients = defaultdict(list)
+    for recipe, name in IngredientInRecipe.objects.values_list(
+        'recipe',
+        'ingredient__name',
+    ):
+        ingredients[recipe].append(name)
+    for recipe in Recipe.objects.values('id', 'name', 'text').order_by():
+        recipe['ingredients'] = ' '.join(ingredients[recipe['id']])
+        yield recipe
+
+
+recipes_search_catalog = VersionedCatalog(
+    'recipes-search',
+    serialize_recipes_for_search,
+    snapshot_class=RecipeSearchSnapshot,
+)
+
+
+def uses_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector():
+    """Выражение поискового вектора рецепта для UPDATE."""
+    fields = {
+        'name': F('name'),
+        'ingredients': Subquery(
+            IngredientInRecipe.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(names=StringAgg('ingredient__name', ' '))
+            .values('names'),
+        ),
+        'text': F('text'),
+    }
+    vector = None
+    for field, weight, _ in SEARCH_WEIGHTS:
+        part = SearchVector(fields[field], weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(recipe_ids):
+    """Пересчитывает поисковые векторы рецептов.
+
+    Без PostgreSQL вместо этого сбрасывается обратный индекс, и каждый
+    процесс перестраивает его при следующем поиске.
+    """
+    if not uses_search_vector():
+        recipes_search_catalog.bump()
+        return
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        search_vector=get_search_vector(),
+    )
+
+
+def search_recipes(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, от лучших к худшим.
+
+    В PostgreSQL запрос выполняется по GIN-индексу поля search_vector, в
+    остальных базах - по обратному индексу в памяти процесса.
+    """
+    if uses_search_vector():
+        query = SearchQuery(query, config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        )
+    else:
+        ranks = recipes_search_catalog.load().index.search(query)
+        if not ranks:
+            return queryset.none()
+        queryset = queryset.filter(id__in=ranks).annotate(
+            search_rank=Case(
+                *(
+                    When(id=recipe, then=Value(rank))
+                    for recipe, rank in ranks.items()
+                ),
+                output_field=FloatField(),
+            ),
+        )
+    return queryset.order_by('-search_rank', '-created', 'id')
@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.counters import change_counter, change_counters
+from core.relations import relations_changed
+from recipes.coverage import recipe_ingredients_index
+from recipes.images import schedule_renditions
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
+from recipes.search import update_search_vectors
+from users.models import User
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_totals(sender, instance, created, **kwargs):
+    if created:
+        ShoppingCartTotal.objects.change(
+            (instance.user_id,),
+            instance.recipe.ingredient_amounts(),
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_totals(sender, instance, **kwargs):
+    amounts = instance.recipe.ingredient_amounts()
+    ShoppingCartTotal.objects.change(
+        (instance.user_id,),
+        {ingredient: -amount for ingredient, amount in amounts.items()},
+    )
+
+
+@receiver(relations_changed, sender=ShoppingCart)
+def change_totals_in_bulk(sender, user_id, target_ids, delta, **kwargs):
+    ShoppingCartTotal.objects.change(
+        (user_id,),
+        {
+            row['ingredient']: delta * row['amount']
+            for row in IngredientInRecipe.objects.filter(
+                recipe__in=target_ids,
+            )
+            .values('ingredient')
+            .annotate(amount=Sum('amount'))
+            .order_by()
+        },
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def make_image_renditions(sender, instance, raw, **kwargs):
+    name = instance.image.name
+    if raw or not name or instance.get_image_renditions():
+        return
+    transaction.on_commit(lambda: schedule_renditions(instance.id, name))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, raw, **kwargs):
+    # Ингредиенты рецепта сохраняются уже после post_save, поэтому вектор
+    # пересчитывается после фиксации транзакции.
+    if not raw:
+        transaction.on_commit(lambda: update_search_vectors((instance.id,)))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipe_ingredients_index(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    recipe_id = instance.id
+    transaction.on_commit(
+        lambda: recipe_ingredients_index.changed((recipe_id,)),
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def update_recipes_with_ingredient(sender, instance, **kwargs):
+    if kwargs.get('created') or kwargs.get('raw'):
+        return
+    recipe_ids = list(
+        IngredientInRecipe.objects.filter(ingredient=instance).values_list(
+            'recipe',
+            flat=True,
+        ),
+    )
+    if not recipe_ids:
+        return
+
+    def update():
+        update_search_vectors(recipe_ids)
+        recipe_ingredients_index.changed(recipe_ids)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def increase_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrease_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(relations_changed, sender=Favorite)
+def change_favorites_count_in_bulk(sender, target_ids, delta, **kwargs):
+    change_counters(Recipe, target_ids, 'favorites_count', delta)
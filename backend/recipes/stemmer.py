@@ -0,0 +1,116 @@
+"""Стеммер Портера (Snowball) для русского языка.
+
+Используется обратным индексом рецептов, когда база данных не
+PostgreSQL. Алгоритм тот же, что у словаря russian_stem в PostgreSQL,
+поэтому поиск в обоих режимах находит одни и те же формы слов.
+"""
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в вши вшись', True),
+    ('ив ивши ившись ыв ывши ывшись', False),
+)
+ADJECTIVE = (
+    (
+        'ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых '
+        'ую юю ая яя ою ею',
+        False,
+    ),
+)
+PARTICIPLE = (
+    ('ем нн вш ющ щ', True),
+    ('ивш ывш ующ', False),
+)
+REFLEXIVE = (('ся сь', False),)
+VERB = (
+    ('ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно', True),
+    (
+        'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено '
+        'ят ует уют ит ыт ены ить ыть ишь ую ю',
+        False,
+    ),
+)
+NOUN = (
+    (
+        'а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем '
+        'ам ом о у ах иях ях ы ь ию ью ю ия ья я',
+        False,
+    ),
+)
+DERIVATIONAL = (('ост ость', False),)
+SUPERLATIVE = (('ейш ейше', False),)
+
+
+def _region(word, start):
+    """Начало области после первой согласной, идущей за гласной."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def _remove_ending(word, start, groups):
+    """Удаляет самое длинное окончание из groups, лежащее в word[start:].
+
+    Окончания в группах перечислены через пробел. Окончания групп с
+    флагом True должны идти после «а» или «я», которые тоже лежат в
+    word[start:]. Возвращает None, если окончание не найдено.
+    """
+    found = None
+    for endings, after_a in groups:
+        for ending in endings.split():
+            if (
+                word.endswith(ending)
+                and len(word) - len(ending) >= start
+                and (found is None or len(ending) > len(found[0]))
+            ):
+                found = (ending, after_a)
+    if found is None:
+        return None
+    ending, after_a = found
+    stem = word[: len(word) - len(ending)]
+    if after_a and (len(stem) <= start or stem[-1] not in 'ая'):
+        return None
+    return stem
+
+
+def stem(word):
+    """Возвращает основу русского слова в нижнем регистре."""
+    word = word.lower().replace('ё', 'е')
+    rv = next(
+        (
+            position + 1
+            for position, letter in enumerate(word)
+            if letter in VOWELS
+        ),
+        len(word),
+    )
+    r2 = _region(word, _region(word, 0))
+
+    result = _remove_ending(word, rv, PERFECTIVE_GERUND)
+    if result is None:
+        word = _remove_ending(word, rv, REFLEXIVE) or word
+        result = _remove_ending(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _remove_ending(result, rv, PARTICIPLE) or result
+        else:
+            result = _remove_ending(word, rv, VERB)
+            if result is None:
+                result = _remove_ending(word, rv, NOUN)
+    if result is not None:
+        word = result
+
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+
+    word = _remove_ending(word, r2, DERIVATIONAL) or word
+
+    result = _remove_ending(word, rv, SUPERLATIVE)
+    if result is not None:
+        word = result
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) > rv:
+        word = word[:-1]
+    return word
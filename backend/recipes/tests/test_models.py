@@ -11,6 +11,7 @@ from recipes.models import (
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingCartTotal,
     Tag,
 )
 from recipes.utils import cut_string
@@ -120,6 +121,8 @@ class RecipesModelsTests(TestCase):
             'text': 'описание',
             'ingredients': 'список ингредиентов',
             'cooking_time': 'время приготовления (в минутах)',
+            'favorites_count': 'число добавлений в избранное',
+            'image_renditions': 'уменьшенные копии картинки',
         }
         for value, expected in field_verboses.items():
             with self.subTest(value=value, expected=expected):
@@ -138,6 +141,8 @@ class RecipesModelsTests(TestCase):
             'text': 'Введите описание рецепта',
             'ingredients': 'Выберите ингредиенты',
             'cooking_time': 'Введите время приготовления (в минутах)',
+            'favorites_count': 'Число добавлений рецепта в избранное',
+            'image_renditions': 'Имена файлов уменьшенных копий картинки',
         }
         for value, expected in field_help_texts.items():
             with self.subTest(value=value, expected=expected):
@@ -302,3 +307,34 @@ class ShoppingCartsModelsTests(TestCase):
                     ShoppingCart._meta.get_field(value).help_text,
                     expected,
                 )
+
+
+class ShoppingCartTotalsModelsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.total = mixer.blend('recipes.ShoppingCartTotal')
+
+    def test_shopping_cart_total_correct_def_str(self) -> None:
+        """
+        Проверяем, что у модели ShoppingCartTotal корректно работает __str__.
+        """
+        self.assertEqual(
+            f'`{self.total.user}` должен купить `{self.total.ingredient}`',
+            str(self.total),
+        )
+
+    def test_shopping_cart_total_correct_verbose_name(self) -> None:
+        """
+        verbose_name в полях модели ShoppingCartTotal совпадают с ожидаемыми.
+        """
+        field_verboses = {
+            'user': 'пользователь',
+            'ingredient': 'ингредиент',
+            'total': 'итоговое количество',
+        }
+        for value, expected in field_verboses.items():
+            with self.subTest(value=value, expected=expected):
+                self.assertEqual(
+                    ShoppingCartTotal._meta.get_field(value).verbose_name,
+                    expected,
+                )
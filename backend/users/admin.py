@@ -6,7 +6,15 @@ from users.models import Subscribe, User
 
 @admin.register(User)
 class UserAdmin(BaseAdmin):
-    list_display = ('pk', 'email', 'username', 'first_name', 'last_name')
+    list_display = (
+        'pk',
+        'email',
+        'username',
+        'first_name',
+        'last_name',
+        'recipes_count',
+        'followers_count',
+    )
     list_filter = ('first_name', 'email')
     search_fields = ('username',)
 
@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count'),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    User.objects.update(
+        recipes_count=count_related(Recipe, 'author'),
+        followers_count=count_related(Subscribe, 'following'),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('users', '0002_changing_verbose_name_in_the_User_model'),
+        ('recipes', '0008_Added_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='Число подписчиков пользователя',
+                verbose_name='число подписчиков',
+            ),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='Число рецептов пользователя',
+                verbose_name='число рецептов',
+            ),
+        ),
+        migrations.RunPython(
+            fill_counters,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from core.models import CountersModel
 
-class User(AbstractUser):
+
+class User(CountersModel, AbstractUser):
     email = models.EmailField('email', unique=True, help_text='Введите Email')
     first_name = models.CharField(
         'имя',
@@ -14,6 +16,20 @@ class User(AbstractUser):
         max_length=150,
         help_text='Введите фамилию',
     )
+    recipes_count = models.PositiveIntegerField(
+        'число рецептов',
+        default=0,
+        editable=False,
+        help_text='Число рецептов пользователя',
+    )
+    followers_count = models.PositiveIntegerField(
+        'число подписчиков',
+        default=0,
+        editable=False,
+        help_text='Число подписчиков пользователя',
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -2,7 +2,6 @@ from djoser.serializers import UserSerializer
 from rest_framework.fields import SerializerMethodField
 
 from api import serializers
-from recipes.models import Recipe
 from users.models import Subscribe, User
 
 
@@ -21,6 +20,8 @@ class SpecialUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, object):
+        if hasattr(object, 'is_subscribed'):
+            return object.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -34,9 +35,6 @@ class SubscribeSerializer(SpecialUserSerializer):
     recipes = SerializerMethodField(
         read_only=True,
     )
-    recipes_count = SerializerMethodField(
-        read_only=True,
-    )
 
     class Meta(SpecialUserSerializer.Meta):
         fields = SpecialUserSerializer.Meta.fields + (
@@ -48,7 +46,7 @@ class SubscribeSerializer(SpecialUserSerializer):
         return True
 
     def get_recipes(self, object):
-        recipes = Recipe.objects.filter(author=object)
+        recipes = object.recipe_set.all()
         recipes_limit = self.context.get('request').GET.get('recipes_limit')
         if recipes_limit:
             recipes = recipes[: int(recipes_limit)]
@@ -57,6 +55,3 @@ class SubscribeSerializer(SpecialUserSerializer):
             many=True,
         ).data
         return recipes
-
-    def get_recipes_count(self, object):
-        return Recipe.objects.filter(author=object).count()
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import forget_token
+from core.counters import change_counter, change_counters
+from core.relations import relations_changed
+from users.models import Subscribe, User
+
+
+@receiver(post_save, sender=Subscribe)
+def increase_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.following_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def decrease_followers_count(sender, instance, **kwargs):
+    change_counter(User, instance.following_id, 'followers_count', -1)
+
+
+@receiver(relations_changed, sender=Subscribe)
+def change_followers_count_in_bulk(sender, target_ids, delta, **kwargs):
+    change_counters(User, target_ids, 'followers_count', delta)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key',
+        flat=True,
+    ):
+        forget_token(key)
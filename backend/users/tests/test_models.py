@@ -22,6 +22,8 @@ class UsersModelsTests(TestCase):
             'email': 'email',
             'first_name': 'имя',
             'last_name': 'фамилия',
+            'recipes_count': 'число рецептов',
+            'followers_count': 'число подписчиков',
             'password': 'пароль',
             'username': 'имя пользователя',
         }
@@ -38,6 +40,8 @@ class UsersModelsTests(TestCase):
             'email': 'Введите Email',
             'first_name': 'Введите имя',
             'last_name': 'Введите фамилию',
+            'recipes_count': 'Число рецептов пользователя',
+            'followers_count': 'Число подписчиков пользователя',
             'username': (
                 'Обязательное поле. Не более 150 символов. Только буквы,'
                 ' цифры и символы @/./+/-/_.'
@@ -1,10 +1,22 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from mixer.backend.django import mixer
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from core.authentication import local_tokens, token_cache_key
+from recipes.models import Recipe
 from users.models import Subscribe, User
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 
 class UsersViewsTests(TestCase):
     @classmethod
@@ -118,3 +130,186 @@ class SubscribeViewsTests(TestCase):
             Subscribe.objects.count(),
             settings.CHECK_ONE_OBJECT_FOR_TEST,
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SubscriptionsQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.authors = mixer.cycle(6).blend(User)
+        for number, author in enumerate(cls.authors):
+            mixer.blend('users.Subscribe', user=cls.user, following=author)
+            mixer.cycle(number + 1).blend('recipes.Recipe', author=author)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_subscriptions_queries_do_not_depend_on_page_size(self) -> None:
+        """Число запросов к подпискам не зависит от числа авторов."""
+        url = '/api/users/subscriptions/?recipes_limit=3&limit='
+        with CaptureQueriesContext(connection) as small_page:
+            self.authorized_user.get(f'{url}1')
+        with CaptureQueriesContext(connection) as large_page:
+            self.authorized_user.get(f'{url}6')
+        self.assertEqual(len(small_page), len(large_page))
+
+    def test_subscriptions_recipes_limit(self) -> None:
+        """recipes_limit ограничивает рецепты каждого автора."""
+        for recipes_limit in ('', '2'):
+            with self.subTest(recipes_limit=recipes_limit):
+                authors = self.authorized_user.get(
+                    '/api/users/subscriptions/?limit=6'
+                    f'&recipes_limit={recipes_limit}',
+                ).json()['results']
+                for author in authors:
+                    count = Recipe.objects.filter(author=author['id']).count()
+                    self.assertEqual(author['recipes_count'], count)
+                    self.assertEqual(
+                        [recipe['id'] for recipe in author['recipes']],
+                        list(
+                            Recipe.objects.filter(author=author['id'])
+                            .order_by('-created', 'id')
+                            .values_list('id', flat=True)[
+                                : int(recipes_limit or count)
+                            ],
+                        ),
+                    )
+
+
+class SubscribeBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+        cls.authors = mixer.cycle(3).blend(User)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+
+        cls.authorized_user = APIClient()
+
+        cls.authorized_user.force_authenticate(cls.user)
+
+    def test_subscribe_bulk(self) -> None:
+        """Массовая подписка возвращает результат для каждого id."""
+        first, second, third = (author.id for author in self.authors)
+        mixer.blend(
+            'users.Subscribe', user=self.user, following=self.authors[0]
+        )
+        response = self.authorized_user.post(
+            '/api/users/subscribe/bulk/',
+            {'ids': [first, second, self.user.id, third + 1]},
+            format='json',
+        )
+        self.assertEqual(
+            response.json(),
+            [
+                {'id': first, 'status': 'exists'},
+                {'id': second, 'status': 'added'},
+                {'id': self.user.id, 'status': 'not_found'},
+                {'id': third + 1, 'status': 'not_found'},
+            ],
+        )
+        self.authors[1].refresh_from_db()
+        self.assertEqual(self.authors[1].followers_count, 1)
+        response = self.authorized_user.delete(
+            '/api/users/subscribe/bulk/',
+            {'ids': [first, second, third]},
+            format='json',
+        )
+        self.assertEqual(
+            [result['status'] for result in response.json()],
+            ['deleted', 'deleted', 'missing'],
+        )
+        self.assertFalse(Subscribe.objects.exists())
+        self.assertEqual(
+            list(
+                User.objects.filter(
+                    id__in=(first, second, third),
+                ).values_list('followers_count', flat=True),
+            ),
+            [0, 0, 0],
+        )
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = mixer.blend(User)
+
+    def setUp(self) -> None:
+        cache.clear()
+        local_tokens.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_token_queries(self) -> list:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query['sql']
+            for query in queries
+            if Token._meta.db_table in query['sql']
+        ]
+
+    def test_token_lookup_cached(self) -> None:
+        """Пользователь по токену ищется в БД только один раз."""
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(self.get_token_queries(), [])
+        local_tokens.clear()
+        self.assertEqual(self.get_token_queries(), [])
+
+    def test_cache_keeps_only_credentials(self) -> None:
+        """В кэше нет данных пользователя, профиль читается из БД."""
+        self.get_token_queries()
+        self.assertEqual(
+            cache.get(token_cache_key(self.token.key)),
+            (self.user.id, True),
+        )
+        User.objects.filter(id=self.user.id).update(
+            first_name='Новое имя', followers_count=5
+        )
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['first_name'], 'Новое имя')
+        response = self.client.patch(
+            '/api/users/me/', {'last_name': 'Новая фамилия'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Новое имя')
+        self.assertEqual(self.user.last_name, 'Новая фамилия')
+        self.assertEqual(self.user.followers_count, 5)
+
+    def test_cache_invalidated(self) -> None:
+        """Кэш очищается при выходе и изменении пользователя."""
+        self.get_token_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code,
+            HTTPStatus.UNAUTHORIZED,
+        )
+        self.user.is_active = True
+        self.user.save()
+        self.get_token_queries()
+        self.assertEqual(
+            self.client.post('/api/auth/token/logout/').status_code,
+            HTTPStatus.NO_CONTENT,
+        )
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code,
+            HTTPStatus.UNAUTHORIZED,
+        )
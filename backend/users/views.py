@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -6,6 +8,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from core.paginations import LimitPagination
+from core.relations import delete_relation, insert_relation
+from core.utils import bulk_add_delete_objects
+from recipes.models import Recipe
 from users.models import Subscribe, User
 from users.serializers import SpecialUserSerializer, SubscribeSerializer
 
@@ -20,16 +25,11 @@ class SpecialUserViewSet(UserViewSet):
         methods=('POST', 'DELETE'),
         detail=True,
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         user = request.user
         following = get_object_or_404(User, id=id)
-        subscribe = Subscribe.objects.filter(user=user, following=following)
         if request.method == 'POST':
-            if subscribe.exists():
-                return Response(
-                    {'error': 'Нельзя подписаться повторно на одного автора!'},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
             if user == following:
                 return Response(
                     {'error': 'Нельзя подписаться на самого себя!'},
@@ -39,21 +39,46 @@ class SpecialUserViewSet(UserViewSet):
                 following,
                 context={'request': request},
             ).data
-            Subscribe.objects.create(user=user, following=following)
-            return Response(serializer, status=status.HTTP_201_CREATED)
-        if subscribe.exists():
-            subscribe.delete()
+            if insert_relation(Subscribe, user=user, following=following):
+                return Response(serializer, status=status.HTTP_201_CREATED)
+            return Response(
+                {'error': 'Нельзя подписаться повторно на одного автора!'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if delete_relation(Subscribe, user=user, following=following):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'error': 'Вы не подписаны на этого автора!'},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    @action(
+        methods=('POST', 'DELETE'),
+        detail=False,
+        url_path='subscribe/bulk',
+    )
+    def subscribe_bulk(self, request):
+        return bulk_add_delete_objects(
+            request,
+            Subscribe,
+            'following',
+            User.objects.exclude(id=request.user.id),
+        )
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
+        # Рецепты группируются по авторам при prefetch, поэтому сортировка
+        # по автору ничего не меняет в ответе, зато совпадает с индексом
+        # recipe_author_created_idx и не требует обхода всех рецептов.
+        recipes = Recipe.objects.order_by('author', '-created', 'id')
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit():
+            recipes = recipes.latest_per_author(int(recipes_limit))
         subscriptions = SubscribeSerializer(
             self.paginate_queryset(
-                User.objects.filter(following__user=request.user),
+                User.objects.filter(
+                    following__user=request.user,
+                ).prefetch_related(Prefetch('recipe_set', queryset=recipes)),
             ),
             many=True,
             context={'request': request},